@@ -19,6 +19,11 @@ intents.message_content = True
 
 bot = discord.Bot(intents=intents)
 
-bot.add_cog(Commands(bot))
-
-bot.run(Config().token)
\ No newline at end of file
+config = Config()
+commands = Commands(bot, config)
+bot.add_cog(commands)
+
+try:
+    bot.run(config.token)
+finally:
+    commands.catalogues.close()
\ No newline at end of file
@@ -1,5 +1,15 @@
+from midibot.metrics import Metrics
 from midibot.store import Store
+from midibot.journal import JournalStore
+from midibot.sqlitestore import SqliteStore
 from midibot.config import Config
+from midibot.blobs import BlobStore
+from midibot.analysis import MidiAnalyser
 from midibot.songmodal import SongModal
+from midibot.paginator import Paginator
+from midibot.song import Ratings, Song
+from midibot.songindex import SongIndex
 from midibot.songs import Songs
+from midibot.catalogues import Catalogues
+from midibot.bundles import BundleCache
 from midibot.commands import Commands
\ No newline at end of file
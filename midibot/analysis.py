@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union
+
+from mido import MidiFile, tempo2bpm
+
+from midibot import BlobStore, Store
+
+_log = logging.getLogger(__name__)
+
+note_names = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+
+def note_name(note: int) -> str:
+    return f"{note_names[note % 12]}{note // 12 - 1}"
+
+
+def analyse(file: str) -> dict:
+    midi = MidiFile(file)
+
+    duration = 0.0
+    notes = 0
+    tempo = None
+    lowest = None
+    highest = None
+
+    for msg in midi:
+        duration += msg.time
+        if msg.type == "set_tempo" and tempo is None:
+            tempo = msg.tempo
+        elif msg.type == "note_on" and msg.velocity > 0:
+            notes += 1
+            lowest = msg.note if lowest is None else min(lowest, msg.note)
+            highest = msg.note if highest is None else max(highest, msg.note)
+
+    return {
+        "tracks": len(midi.tracks),
+        "notes": notes,
+        "duration": round(duration, 1),
+        "tempo": round(tempo2bpm(tempo if tempo is not None else 500000)),
+        "lowest": lowest,
+        "highest": highest,
+        "pianovision": len(midi.tracks) < 3,
+    }
+
+
+class MidiAnalyser:
+    """Analyses MIDI files in a process pool and keeps the results per song id,
+    together with the hash of the file they were taken from."""
+
+    def __init__(self, workers: int, file: str, delay: float = 0):
+        self.__pool = ProcessPoolExecutor(max_workers=workers)
+        self.__cache = Store[dict](file, {}, delay=delay)
+
+    def get(self, id: str) -> Union[None, dict]:
+        return self.__cache.data.get(id)
+
+    def forget(self, id: str):
+        if self.__cache.data.pop(id, None) is not None:
+            self.__cache.sync()
+
+    async def analyse(self, id: str, file: str, digest: str = None) -> bool:
+        """Analyse ``file`` for song ``id`` unless it was already analysed, returns whether anything changed."""
+        loop = asyncio.get_running_loop()
+
+        try:
+            digest = digest or await loop.run_in_executor(self.__pool, BlobStore.hash, file)
+            if (cached := self.get(id)) and cached["hash"] == digest:
+                return False
+
+            info = await loop.run_in_executor(self.__pool, analyse, file)
+        except Exception:
+            _log.exception(f"Couldn't analyse '{file}'")
+            return False
+
+        info["hash"] = digest
+        self.__cache.data[id] = info
+        self.__cache.sync()
+        return True
+
+    def close(self):
+        self.__cache.close()
+        self.__pool.shutdown(wait=False, cancel_futures=True)
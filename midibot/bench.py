@@ -0,0 +1,189 @@
+"""Benchmarks for Songs and its stores on synthetic catalogues.
+
+    python -m midibot.bench --sizes 1000 10000 100000 --storage json journal sqlite
+
+Every run works in a fresh temporary directory, so the bot's own data is
+never touched. Results are reproducible for the same ``--seed``.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import yaml
+
+words = (
+    "love night heart fire dream light rain time moon star dance blue girl away home world "
+    "river summer shadow golden silver road wild city ocean midnight angel storm sky forever "
+    "young broken sweet lonely paradise memory rose winter ghost train dust thunder echo"
+).split()
+
+versions = ["", "", "", "", "Piano Solo", "Easy", "Live", "Acoustic", "Intermediate", "4 hands"]
+
+
+class Catalogue:
+    """A synthetic song list with a Zipf-like number of songs per artist."""
+
+    def __init__(self, size: int, seed: int = 0):
+        self.random = random.Random(seed)
+        self.size = size
+        self.artists = [self.__title(self.random.randint(1, 3)) for _ in range(max(1, size // 8))]
+        self.weights = [1 / (rank + 1) for rank in range(len(self.artists))]
+
+    def __title(self, length: int) -> str:
+        return " ".join(self.random.choice(words).capitalize() for _ in range(length))
+
+    def song(self) -> dict:
+        kind = self.random.random()
+        song_type = "verified" if kind < 0.7 else "unverified" if kind < 0.9 else "requested"
+        song_id = str(uuid.UUID(int=self.random.getrandbits(128)))
+        song = {
+            "id": song_id,
+            "type": song_type,
+            "artist": self.random.choices(self.artists, self.weights)[0],
+            "song": self.__title(self.random.randint(1, 5)),
+            "version": self.random.choice(versions),
+            "origin": f"https://musescore.com/user/{self.random.randrange(10**6)}/scores/{self.random.randrange(10**7)}"
+            if self.random.random() < 0.6 else "",
+        }
+        if song_type == "requested":
+            song["requested_by"] = self.random.randrange(10**17, 10**18)
+        else:
+            song["added_by"] = self.random.randrange(10**17, 10**18)
+
+        ratings = {f"{self.random.randrange(10**17, 10**18)}": self.random.randint(0, 5) for _ in range(self.random.randrange(6))}
+        if ratings:
+            song["ratings"] = ratings
+            song["rating"] = sum(ratings.values()) / len(ratings)
+        return song
+
+    def songs(self) -> list[dict]:
+        return [self.song() for _ in range(self.size)]
+
+    def queries(self, songs: list[dict], count: int) -> list[str]:
+        queries = []
+        for _ in range(count):
+            display = f'{self.random.choice(songs)["artist"]} - {self.random.choice(songs)["song"]}'.lower()
+            start = self.random.randrange(len(display))
+            queries.append(display[start:start + self.random.randint(1, 8)])
+        return queries
+
+    def attach(self, songs: list[dict], blob_dir: str, distinct: int = 64):
+        """Give verified and unverified songs files, shared between songs like deduplicated uploads are."""
+        digests = []
+        for i in range(distinct):
+            content = self.random.randbytes(self.random.randint(1024, 64 * 1024))
+            digest = hashlib.sha256(content).hexdigest()
+            os.makedirs(f"{blob_dir}/{digest[:2]}", exist_ok=True)
+            with open(f"{blob_dir}/{digest[:2]}/{digest}", "wb") as file:
+                file.write(content)
+            digests.append(digest)
+
+        for song in songs:
+            if song["type"] != "requested":
+                song["files"] = {".mid": self.random.choice(digests)}
+                if self.random.random() < 0.5:
+                    song["files"][".mscz"] = self.random.choice(digests)
+
+
+class Result:
+    def __init__(self, name: str, timings: list[float]):
+        self.name = name
+        self.timings = sorted(timings)
+
+    def percentile(self, p: float) -> float:
+        return self.timings[min(len(self.timings) - 1, int(len(self.timings) * p))]
+
+    @property
+    def throughput(self) -> float:
+        return len(self.timings) / sum(self.timings) if sum(self.timings) else float("inf")
+
+    def row(self) -> str:
+        return (
+            f"{self.name:<18}{len(self.timings):>8}{self.throughput:>14.0f}"
+            f"{self.percentile(0.5) * 1e6:>12.1f}{self.percentile(0.99) * 1e6:>12.1f}"
+        )
+
+
+def measure(name: str, operation, arguments: list) -> Result:
+    timings = []
+    for argument in arguments:
+        start = time.perf_counter()
+        operation(argument)
+        timings.append(time.perf_counter() - start)
+    return Result(name, timings)
+
+
+def run(size: int, storage: str, operations: int, seed: int) -> list[Result]:
+    from midibot import Config, Songs, Store
+
+    catalogue = Catalogue(size, seed)
+
+    with tempfile.TemporaryDirectory(prefix="midibot-bench-") as directory:
+        songs_data = catalogue.songs()
+        catalogue.attach(songs_data, f"{directory}/blobs")
+        with open(f"{directory}/songs.json", "w") as file:
+            json.dump(songs_data, file)
+        with open(f"{directory}/config.yaml", "w") as file:
+            yaml.safe_dump({"storage": storage, "sync_delay": 0, "analysis_workers": 1}, file)
+
+        start = time.perf_counter()
+        songs = Songs(Config(f"{directory}/config.yaml"), directory)
+        results = [Result("load", [time.perf_counter() - start])]
+
+        loop = asyncio.new_event_loop()
+        try:
+            queries = catalogue.queries(songs_data, operations)
+            results.append(measure("song_search", lambda q: loop.run_until_complete(songs.song_search(q)), queries))
+        finally:
+            loop.close()
+
+        displays = [songs.song_to_string(catalogue.random.choice(songs_data)) for _ in range(operations)]
+        results.append(measure("get", songs.get, displays))
+
+        existing = [songs.get(display) for display in displays]
+        results.append(measure("has_attachments", songs.has_attachments, existing))
+
+        users = [catalogue.random.randrange(10**17, 10**18) for _ in range(operations)]
+        results.append(measure("rate", lambda i: songs.rate(existing[i], users[i], users[i] % 6), range(operations)))
+
+        new_songs = [
+            {key: value for key, value in catalogue.song().items() if key not in ("id", "rating", "ratings")}
+            for _ in range(operations)
+        ]
+        results.append(measure("add_song", songs.add_song, new_songs))
+
+        results.append(measure("sync", lambda _: songs.sync(), range(max(1, operations // 100))))
+
+        plain = Store[list](f"{directory}/plain.json", [])
+        plain.data = songs_data
+        results.append(measure("Store.sync", lambda _: plain.sync(), range(max(1, operations // 100))))
+
+        songs.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--storage", nargs="+", default=["json"], choices=["json", "journal", "sqlite"])
+    parser.add_argument("--operations", type=int, default=1000, help="timed calls per operation")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for storage in args.storage:
+        for size in args.sizes:
+            print(f"\n{size} songs, {storage} storage")
+            print(f'{"operation":<18}{"calls":>8}{"ops/s":>14}{"p50 us":>12}{"p99 us":>12}')
+            for result in run(size, storage, args.operations, args.seed):
+                print(result.row())
+
+
+if __name__ == "__main__":
+    main()
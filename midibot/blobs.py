@@ -0,0 +1,85 @@
+from collections import Counter
+import hashlib
+import logging
+import os
+import uuid
+
+_log = logging.getLogger(__name__)
+
+
+class BlobStore:
+    """Content addressed file storage, files are stored once under their sha256
+    and deleted when the last reference to them is released."""
+
+    def __init__(self, directory: str):
+        self.__directory = directory
+        self.__refs: Counter[str] = Counter()
+        os.makedirs(directory, exist_ok=True)
+
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith("tmp.") and entry.is_file():
+                    os.remove(entry.path)
+
+    def path(self, digest: str) -> str:
+        return f"{self.__directory}/{digest[:2]}/{digest}"
+
+    def temp_path(self) -> str:
+        return f"{self.__directory}/tmp.{uuid.uuid4()}"
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def add(self, file: str, digest: str = None) -> str:
+        """Move ``file`` into the store, returns its digest. The file is dropped if the store already has it."""
+        digest = digest or self.hash(file)
+        path = self.path(digest)
+
+        if os.path.exists(path):
+            os.remove(file)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(file, path)
+
+        return digest
+
+    def reference(self, digest: str):
+        self.__refs[digest] += 1
+
+    def release(self, digest: str):
+        self.__refs[digest] -= 1
+        if self.__refs[digest] > 0:
+            return
+
+        del self.__refs[digest]
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+
+    def stored(self) -> set[str]:
+        digests = set()
+        with os.scandir(self.__directory) as prefixes:
+            for prefix in prefixes:
+                if prefix.is_dir():
+                    with os.scandir(prefix.path) as entries:
+                        digests.update(entry.name for entry in entries if entry.is_file())
+        return digests
+
+    def collect_garbage(self) -> int:
+        removed = 0
+        for digest in self.stored():
+            if digest not in self.__refs:
+                os.remove(self.path(digest))
+                removed += 1
+        if removed:
+            _log.info(f"Removed {removed} unreferenced files from '{self.__directory}'")
+        return removed
+
+    @staticmethod
+    def hash(file: str) -> str:
+        digest = hashlib.sha256()
+        with open(file, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                digest.update(chunk)
+        return digest.hexdigest()
@@ -0,0 +1,397 @@
+"""Import and export whole song catalogues.
+
+    python -m midibot.bulk import library.zip --added-by 123456789
+    python -m midibot.bulk export backup.zip
+
+A bundle is a directory or zip file with a songs.jsonl or songs.csv manifest
+and the files it names. JSONL rows are songs like the ones in data/songs.json,
+with "files" mapping extensions to paths in the bundle. CSV rows have artist,
+song, version, origin, type, requested_by and added_by columns, and mid, mscz
+and json columns with the paths of the files.
+
+The CLI works on data/ directly, so don't run it while the bot is running,
+use /import_songs and /export_songs there instead.
+"""
+import argparse
+import asyncio
+import csv
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Callable, Iterator, Union
+
+from midibot import Song, Songs, Store, ingest
+from midibot.bundles import compression
+
+_log = logging.getLogger(__name__)
+
+
+class Bundle:
+    """A directory or zip file holding a manifest and the files it names."""
+
+    manifests = ("songs.jsonl", "songs.csv")
+
+    def __init__(self, path: str):
+        self.path = path
+        self.__zip: zipfile.ZipFile = None
+        if not os.path.isdir(path):
+            self.__zip = zipfile.ZipFile(path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self.__zip is not None:
+            self.__zip.close()
+
+    def manifest(self) -> Union[None, str]:
+        for name in Bundle.manifests:
+            if self.__zip is not None:
+                if name in self.__zip.NameToInfo:
+                    return name
+            elif os.path.isfile(os.path.join(self.path, name)):
+                return name
+        return None
+
+    def open(self, name: str) -> IO[bytes]:
+        """Open the file ``name`` of the bundle, names can't point outside of a directory bundle."""
+        if self.__zip is not None:
+            return self.__zip.open(name)
+
+        root = os.path.realpath(self.path)
+        file = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, file]) != root:
+            raise FileNotFoundError(name)
+        return open(file, "rb")
+
+
+# bundles opened by a worker process, kept open so a zip's directory is only read once
+bundles: dict[str, Bundle] = {}
+
+
+def prepare(path: str, name: str, ext: str, tmp: str, limit: int) -> tuple[Union[None, str], str]:
+    """Copy ``name`` out of the bundle at ``path`` to ``tmp`` and check it, runs in a worker process.
+    Returns an error, or None and the digest of the file."""
+    if (bundle := bundles.get(path)) is None:
+        bundle = bundles[path] = Bundle(path)
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with bundle.open(name) as source, open(tmp, "wb") as out:
+            while chunk := source.read(ingest.chunk_size):
+                size += len(chunk)
+                if size > limit:
+                    return f"{name} is bigger than {limit // (1024 * 1024)} MB", ""
+                out.write(chunk)
+                digest.update(chunk)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return f"{name} is missing from the bundle", ""
+
+    if error := ingest.validate(tmp, ext):
+        return f"{name}: {error}", ""
+    return None, digest.hexdigest()
+
+
+class Manifest:
+    """Reads the rows of a manifest one at a time."""
+
+    file_columns = {"mid": Songs.File.MIDI, "mscz": Songs.File.MUSESCORE, "json": Songs.File.PIANOVISION}
+
+    def __init__(self, file: IO[str], csv: bool):
+        self.file = file
+        self.csv = csv
+
+    def __iter__(self) -> Iterator[tuple[int, Union[dict, str]]]:
+        """Yields the line of every row with the row, or with what is wrong with it."""
+        if self.csv:
+            reader = csv.DictReader(self.file)
+            for row in reader:
+                yield reader.line_num, self.__from_csv(row)
+            return
+
+        for line, text in enumerate(self.file, 1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                yield line, "not valid JSON"
+                continue
+            yield line, row if isinstance(row, dict) else "not a JSON object"
+
+    def __from_csv(self, row: dict) -> dict:
+        data = {
+            key: value.strip()
+            for key, value in row.items()
+            if key and isinstance(value, str) and value.strip() and key not in Manifest.file_columns
+        }
+        files = {
+            ext: row[column].strip()
+            for column, ext in Manifest.file_columns.items()
+            if (row.get(column) or "").strip()
+        }
+        if files:
+            data["files"] = files
+        return data
+
+
+class Report:
+    def __init__(self):
+        self.added = 0
+        self.files = 0
+        self.errors: list[tuple[int, str]] = []
+        # set when the bundle couldn't be read at all
+        self.failed: Union[None, str] = None
+
+    def error(self, line: int, error: str):
+        self.errors.append((line, error))
+
+    def summary(self, limit: int = None) -> str:
+        if self.failed:
+            return self.failed
+
+        lines = [f"Imported {self.added} songs with {self.files} files, skipped {len(self.errors)} rows."]
+        errors = sorted(self.errors)
+        shown = errors if limit is None else errors[:limit]
+        lines += [f"line {line}: {error}" for line, error in shown]
+        if len(shown) < len(self.errors):
+            lines.append(f"... and {len(self.errors) - len(shown)} more")
+        return "\n".join(lines)
+
+
+class Importer:
+    """Adds the songs of a bundle to a catalogue.
+
+    The manifest is read and checked in chunks of rows. The files of a chunk
+    are copied into the file store and validated by a process pool, then the
+    chunk's songs are added. Nothing is written until every row is done, all
+    of it is then persisted with a single sync.
+    """
+
+    chunk_size = 256
+
+    user_fields = ("requested_by", "added_by")
+
+    # everything else in a row, like "id" or "files", is either replaced or ignored
+    song_keys = (*Song.fields, "type", *user_fields, "ratings")
+
+    def __init__(self, songs: Songs, workers: int, max_file_size: int, defaults: dict = None):
+        self.songs = songs
+        self.workers = workers
+        self.max_file_size = max_file_size
+        self.defaults = defaults or {}
+
+    async def run(self, path: str) -> Report:
+        report = Report()
+        try:
+            bundle = Bundle(path)
+        except (OSError, zipfile.BadZipFile):
+            report.failed = "That isn't a zip file."
+            return report
+
+        with bundle, ProcessPoolExecutor(max_workers=self.workers) as pool, self.songs.batch():
+            if (manifest := bundle.manifest()) is None:
+                report.failed = f'There is no {" or ".join(Bundle.manifests)} in there.'
+                return report
+
+            with io.TextIOWrapper(bundle.open(manifest), encoding="utf-8-sig") as file:
+                chunk = []
+                for line, row in Manifest(file, manifest.endswith(".csv")):
+                    if isinstance(row, dict):
+                        row = self.__check(row)
+                    if isinstance(row, str):
+                        report.error(line, row)
+                        continue
+
+                    chunk.append((line, *row))
+                    if len(chunk) >= Importer.chunk_size:
+                        await self.__import(pool, path, chunk, report)
+                        chunk = []
+
+                if chunk:
+                    await self.__import(pool, path, chunk, report)
+
+        _log.info(f"Imported '{path}' into '{self.songs.directory}': {report.summary(limit=0)}")
+        return report
+
+    def __check(self, row: dict) -> Union[str, tuple[dict, dict[str, str]]]:
+        data = {key: value for key, value in row.items() if key in Importer.song_keys}
+        for key, value in self.defaults.items():
+            data.setdefault(key, value)
+
+        if not all(isinstance(data.get(key), str) and data[key].strip() for key in ("artist", "song")):
+            return "artist and song are required"
+        for key in ("artist", "song", "version", "origin"):
+            if not isinstance(data.get(key) or "", str):
+                return f"{key} must be text"
+            data[key] = (data.get(key) or "").strip()
+
+        for key in Importer.user_fields:
+            if data.get(key) is not None:
+                try:
+                    data[key] = int(data[key])
+                except (TypeError, ValueError):
+                    return f"{key} must be a user id"
+
+        if data.get("ratings") is not None:
+            if error := self.__check_ratings(data["ratings"]):
+                return error
+
+        files = row.get("files") or {}
+        if not isinstance(files, dict) or not all(isinstance(name, str) for name in files.values()):
+            return "files must map file types to paths in the bundle"
+        if unknown := [ext for ext in files if ext not in Songs.file_exts]:
+            return f'unknown file types {", ".join(unknown)}'
+
+        data["type"] = data.get("type") or (Songs.Type.VERIFIED if Songs.File.MIDI in files else Songs.Type.REQUESTED)
+        if data["type"] not in Songs.all_types:
+            return f'type must be one of {", ".join(Songs.all_types)}'
+        if data["type"] == Songs.Type.REQUESTED and Songs.File.MIDI in files:
+            data["type"] = Songs.Type.UNVERIFIED
+
+        if error := self.songs.duplicate_error(data):
+            return f"{self.songs.song_to_string(data)}: {error}"
+        return data, files
+
+    def __check_ratings(self, ratings) -> Union[None, str]:
+        if not isinstance(ratings, dict):
+            return "ratings must map user ids to ratings"
+        for user, rating in ratings.items():
+            try:
+                user = int(user)
+            except (TypeError, ValueError):
+                return "ratings must map user ids to ratings"
+            if not 0 <= user < 2**63 or type(rating) is not int or not 0 <= rating <= 5:
+                return "ratings must map user ids to ratings from 0 to 5"
+        return None
+
+    async def __import(self, pool: ProcessPoolExecutor, path: str, chunk: list, report: Report):
+        loop = asyncio.get_running_loop()
+        blobs = self.songs.blobs
+
+        temps = [{ext: blobs.temp_path() for ext in files} for (_, _, files) in chunk]
+        try:
+            prepared = await asyncio.gather(*(
+                asyncio.gather(*(
+                    loop.run_in_executor(pool, prepare, path, name, ext, tmp[ext], self.max_file_size)
+                    for ext, name in files.items()
+                ))
+                for (_, _, files), tmp in zip(chunk, temps)
+            ))
+
+            for (line, data, files), tmp, results in zip(chunk, temps, prepared):
+                errors = [error for error, _ in results if error]
+                # an earlier row or a user may have added the song while its files were checked
+                if not errors and (error := self.songs.duplicate_error(data)):
+                    errors.append(f"{self.songs.song_to_string(data)}: {error}")
+                if errors:
+                    report.error(line, "; ".join(errors))
+                    continue
+
+                data["files"] = {ext: blobs.add(tmp[ext], digest) for ext, (_, digest) in zip(files, results)}
+                self.songs.add_song(data)
+                report.added += 1
+                report.files += len(files)
+        finally:
+            for tmp in temps:
+                for file in tmp.values():
+                    if os.path.exists(file):
+                        os.remove(file)
+
+
+class Exporter:
+    """Writes a catalogue as a bundle ``Importer`` can read, files shared by songs are written once.
+
+    The songs are taken when the exporter is created. ``run`` blocks, on the
+    event loop call it in a worker thread.
+    """
+
+    def __init__(self, songs: Songs):
+        self.songs = list(songs.songs.data)
+        self.blobs = songs.blobs
+
+    def run(self, path: str) -> int:
+        """Write the bundle to ``path``, as a zip file when it ends with .zip. Returns the number of songs."""
+        if not path.endswith(".zip"):
+            os.makedirs(os.path.join(path, "files"), exist_ok=True)
+            copied = set()
+
+            def copy(digest: str, name: str):
+                if digest not in copied:
+                    copied.add(digest)
+                    shutil.copyfile(self.blobs.path(digest), os.path.join(path, name))
+
+            with open(os.path.join(path, Bundle.manifests[0]), "w", encoding="utf-8") as manifest:
+                return self.__write(manifest, copy)
+
+        tmp = f"{path}.tmp"
+        try:
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as bundle:
+                # a zip can't be written to while the manifest is open, so the files are added after it
+                files: dict[str, str] = {}
+                with io.TextIOWrapper(bundle.open(Bundle.manifests[0], "w"), encoding="utf-8") as manifest:
+                    count = self.__write(manifest, files.setdefault)
+
+                for digest, name in files.items():
+                    bundle.write(self.blobs.path(digest), name, compression(name))
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return count
+
+    def __write(self, manifest: IO[str], add: Callable[[str, str], object]) -> int:
+        for song in self.songs:
+            data = Store.encode(song)
+            files = {}
+            for ext, digest in (data.get("files") or {}).items():
+                if self.blobs.exists(digest):
+                    files[ext] = f"files/{digest}{ext}"
+                    add(digest, files[ext])
+            data["files"] = files
+            manifest.write(json.dumps(data) + "\n")
+        return len(self.songs)
+
+
+async def run(args):
+    from midibot import Catalogues, Config
+
+    config = Config()
+    catalogues = Catalogues(config)
+    try:
+        songs = catalogues.of(args.guild)
+        if args.command == "export":
+            count = Exporter(songs).run(args.path)
+            print(f"Exported {count} songs to '{args.path}'")
+            return
+
+        defaults = {"added_by": args.added_by} if args.added_by is not None else {}
+        importer = Importer(songs, config.analysis_workers, config.max_attachment_size, defaults)
+        print((await importer.run(args.path)).summary())
+        await songs.analyse_missing()
+    finally:
+        catalogues.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("path", help="bundle directory or zip file")
+    parser.add_argument("--guild", type=int, help="use the guild's own catalogue instead of the shared one")
+    parser.add_argument("--added-by", type=int, help="user id recorded as the uploader of imported songs that don't name one")
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
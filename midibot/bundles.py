@@ -0,0 +1,85 @@
+from collections import OrderedDict
+import hashlib
+import io
+import zipfile
+from typing import Union
+
+from midibot import Songs
+
+# what a zip adds around a file, generously: its headers and deflate's overhead on data that doesn't compress
+entry_overhead = 1024
+
+
+class BundleCache:
+    """Recently built zip files, keyed by the names and contents of the files in them.
+
+    The least recently used bundles are dropped once the bundles together take
+    more than ``max_size`` bytes.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.__bundles: OrderedDict[str, bytes] = OrderedDict()
+
+    @staticmethod
+    def key(entries: list[tuple[str, str, str]]) -> str:
+        key = hashlib.sha256()
+        for name, digest, _ in entries:
+            key.update(f"{name}\0{digest}\n".encode())
+        return key.hexdigest()
+
+    def get(self, key: str) -> Union[None, bytes]:
+        if (content := self.__bundles.get(key)) is not None:
+            self.__bundles.move_to_end(key)
+        return content
+
+    def put(self, key: str, content: bytes):
+        if len(content) > self.max_size:
+            return
+        if (previous := self.__bundles.pop(key, None)) is not None:
+            self.size -= len(previous)
+
+        self.__bundles[key] = content
+        self.size += len(content)
+        while self.size > self.max_size:
+            _, dropped = self.__bundles.popitem(last=False)
+            self.size -= len(dropped)
+
+
+def split(entries: list[tuple[str, str, str, int]], limit: int) -> tuple[list[list[tuple[str, str, str]]], list[str]]:
+    """Split (name, digest, path, size) entries into bundles that stay below ``limit`` bytes.
+    Returns the bundles and the names of files too big for any bundle."""
+    bundles = []
+    too_big = []
+    bundle = []
+    total = 0
+    for name, digest, path, size in entries:
+        size += entry_overhead + size // 1000
+        if size > limit:
+            too_big.append(name)
+            continue
+        if bundle and total + size > limit:
+            bundles.append(bundle)
+            bundle = []
+            total = 0
+        bundle.append((name, digest, path))
+        total += size
+
+    if bundle:
+        bundles.append(bundle)
+    return bundles, too_big
+
+
+def compression(name: str) -> int:
+    """How ``name`` is compressed in a zip file, MuseScore files are zip files themselves."""
+    return zipfile.ZIP_STORED if name.endswith(Songs.File.MUSESCORE) else zipfile.ZIP_DEFLATED
+
+
+def build(entries: list[tuple[str, str, str]]) -> bytes:
+    """Zip the files straight out of the file store, blocks so run it in a worker thread."""
+    content = io.BytesIO()
+    with zipfile.ZipFile(content, "w") as bundle:
+        for name, _, path in entries:
+            bundle.write(path, name, compression(name))
+    return content.getvalue()
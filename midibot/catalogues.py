@@ -0,0 +1,79 @@
+import logging
+from typing import Union
+
+from midibot import BlobStore, Config, MidiAnalyser, Song, Songs
+
+_log = logging.getLogger(__name__)
+
+
+class Catalogues:
+    """The shared song catalogue plus one catalogue for every guild that has its own.
+
+    Guild catalogues live in guilds/<id> of the data directory and only ever
+    hold that guild's songs, the shared catalogue is used as a read only
+    fallback for them. All catalogues share the file store and the midi
+    analysis.
+    """
+
+    def __init__(self, config: Config):
+        directory = config.directory
+        self.__blobs = BlobStore(f"{directory}/blobs")
+        self.__analyser = MidiAnalyser(config.analysis_workers, f"{directory}/analysis.json", delay=config.sync_delay)
+
+        self.shared = Songs(config, directory, self.__blobs, self.__analyser)
+        self.guilds: dict[int, Songs] = {
+            id: Songs(config, f"{directory}/guilds/{id}", self.__blobs, self.__analyser)
+            for id, guild in config.guilds.items()
+            if guild.own_catalogue
+        }
+        if self.guilds:
+            _log.info(f"Guilds with their own catalogue: {', '.join(str(id) for id in self.guilds)}")
+
+    def __iter__(self):
+        yield self.shared
+        yield from self.guilds.values()
+
+    def of(self, guild_id: Union[None, int]) -> Songs:
+        """The catalogue songs of ``guild_id`` are added to and changed in."""
+        return self.guilds.get(guild_id, self.shared)
+
+    def get(self, guild_id: Union[None, int], songstring: str) -> tuple[Songs, Union[None, Song]]:
+        """Look a song up in the guild's catalogue, then in the shared one."""
+        songs = self.of(guild_id)
+        if (song_obj := songs.get(songstring)) is None and songs is not self.shared:
+            if (song_obj := self.shared.get(songstring)) is not None:
+                return self.shared, song_obj
+        return songs, song_obj
+
+    async def song_search(
+        self,
+        guild_id: Union[None, int],
+        search_string: str,
+        types: list[str] = Songs.all_types,
+        within: set[str] = None,
+        fallback: bool = False,
+    ) -> tuple[list[str], set[str]]:
+        """Search the guild's catalogue, with ``fallback`` topped up with matches from the shared one.
+        ``within`` and the returned ids only concern the guild's catalogue."""
+        songs = self.of(guild_id)
+        results, matched = await songs.song_search(search_string, types, within)
+        if fallback and songs is not self.shared and len(results) < Songs.autocomplete_limit:
+            seen = set(results)
+            shared, _ = await self.shared.song_search(search_string, types)
+            results = results + [x for x in shared if x not in seen][: Songs.autocomplete_limit - len(results)]
+        return results, matched
+
+    def reconcile_attachments(self) -> bool:
+        changed = False
+        for songs in self:
+            changed = songs.reconcile_attachments() or changed
+        return changed
+
+    async def analyse_missing(self):
+        for songs in self:
+            await songs.analyse_missing()
+
+    def close(self):
+        for songs in self:
+            songs.close()
+        self.__analyser.close()
@@ -1,55 +1,241 @@
+import asyncio
+from collections import OrderedDict
+import io
 import logging
 import os
-import shutil
+import time
 from typing import Union
 import uuid
 
 import discord
 
-from midibot import SongModal, Songs
+from midibot import BundleCache, Catalogues, Config, Paginator, Song, SongModal, Songs, bundles, ingest
+from midibot.analysis import note_name
+from midibot.bulk import Exporter, Importer
+from midibot.metrics import registry as metrics
 from discord import Cog, Option, guild_only, slash_command
 from discord.commands import default_permissions
+from discord.ext import tasks
 
 
 _log = logging.getLogger(__name__)
 
-servers = [1004388945422987304, 908282497769558036, 1206713211139792996]
+message_limit = 2000
+
+autocomplete_cache_size = 1024
+
+# larger match sets aren't kept, narrowing them saves little over a new search
+autocomplete_narrow_limit = 1000
+
+# song ids kept in all match sets together, a few MB at most
+autocomplete_cache_ids = 100000
+
+# upload limit of guilds without boosts, and of direct messages
+default_filesize_limit = 25 * 1024 * 1024
+
+bundle_formats = {
+    "all": Songs.file_exts,
+    "midi": [Songs.File.MIDI],
+    "musescore": [Songs.File.MUSESCORE],
+    "pianovision": [Songs.File.PIANOVISION],
+}
 
 
 class Commands(Cog):
-    def __init__(self, bot: discord.Bot):
+    def __init__(self, bot: discord.Bot, config: Config):
         self.bot = bot
-        self.songs = Songs()
+        self.config = config
+        metrics.enabled = config.metrics_port is not None
+        self.catalogues = Catalogues(config)
 
         self.emoji = {}
+        self.list_cache: dict[tuple[str, str], tuple[int, list[dict]]] = {}
+        self.embed_cache: dict[str, tuple[int, discord.Embed]] = {}
+        self.command_started: dict[int, float] = {}
+        self.autocomplete_cache: OrderedDict[tuple, tuple] = OrderedDict()
+        self.autocomplete_cached_ids = 0
+        self.bundle_cache = BundleCache(config.bundle_cache_size)
+
+        self.reconcile_attachments.start()
+
+    @tasks.loop(hours=1)
+    async def reconcile_attachments(self):
+        if self.catalogues.reconcile_attachments():
+            _log.warning("Dropped references to files missing from the file store, unreferenced files were garbage collected")
+
+    @reconcile_attachments.before_loop
+    async def before_reconcile_attachments(self):
+        await self.bot.wait_until_ready()
+
+    @Cog.listener()
+    async def on_ready(self):
+        if metrics.enabled:
+            await metrics.serve(self.config.metrics_host, self.config.metrics_port)
+        await self.catalogues.analyse_missing()
+
+    async def cog_before_invoke(self, ctx: discord.ApplicationContext):
+        if metrics.enabled:
+            self.command_started[ctx.interaction.id] = time.perf_counter()
+
+    async def cog_after_invoke(self, ctx: discord.ApplicationContext):
+        if (started := self.command_started.pop(ctx.interaction.id, None)) is not None:
+            metrics.observe("midibot_command_seconds", time.perf_counter() - started, command=ctx.command.qualified_name)
+
+    @Cog.listener()
+    async def on_application_command_error(self, ctx: discord.ApplicationContext, error: Exception):
+        metrics.count("midibot_command_errors_total", command=ctx.command.qualified_name)
+        # listening for this event replaces py-cord's handler, which would print the traceback
+        _log.error(f"Command {ctx.command.qualified_name} failed", exc_info=error)
+
+    async def autocomplete(
+        self, ctx: discord.AutocompleteContext, callback: str, types: list[str], fallback: bool = False
+    ) -> list[str]:
+        try:
+            return await self.cached_search(ctx, callback, types, fallback)
+        except Exception:
+            metrics.count("midibot_autocomplete_errors_total", callback=callback)
+            raise
+
+    async def cached_search(
+        self, ctx: discord.AutocompleteContext, callback: str, types: list[str], fallback: bool
+    ) -> list[str]:
+        """Search for the user's last query in this option, reusing the previous search while they type.
+
+        When the query extends the previous one, only the songs that matched the previous one are searched.
+        Everything cached is dropped once the catalogue changed."""
+        guild_id = ctx.interaction.guild_id
+        generation = (self.catalogues.of(guild_id).generation, self.catalogues.shared.generation)
+        key = (ctx.interaction.user.id, guild_id, callback)
+        query = ctx.value or ""
+
+        within = None
+        if (cached := self.autocomplete_cache.get(key)) and cached[0] == generation:
+            _, previous, results, matched = cached
+            if query == previous:
+                self.autocomplete_cache.move_to_end(key)
+                metrics.count("midibot_autocomplete_cache_total", result="hit")
+                return results
+            if matched is not None and query.startswith(previous):
+                within = matched
+
+        metrics.count("midibot_autocomplete_cache_total", result="narrowed" if within is not None else "miss")
+        results, matched = await self.catalogues.song_search(guild_id, query, types, within, fallback)
+        if len(matched) > autocomplete_narrow_limit:
+            matched = None
+
+        if (replaced := self.autocomplete_cache.pop(key, None)) and replaced[3] is not None:
+            self.autocomplete_cached_ids -= len(replaced[3])
+        self.autocomplete_cache[key] = (generation, query, results, matched)
+        self.autocomplete_cached_ids += len(matched or ())
+
+        while len(self.autocomplete_cache) > autocomplete_cache_size or self.autocomplete_cached_ids > autocomplete_cache_ids:
+            _, evicted = self.autocomplete_cache.popitem(last=False)
+            self.autocomplete_cached_ids -= len(evicted[3] or ())
+        return results
 
     async def song_search(self, ctx: discord.AutocompleteContext):
-        return await self.songs.song_search(ctx.value)
+        with metrics.timer("midibot_autocomplete_seconds", callback="song_search"):
+            return await self.autocomplete(ctx, "song_search", Songs.all_types)
     
     async def song_search_unverified(self, ctx: discord.AutocompleteContext):
-        return await self.songs.song_search(ctx.value, types=[Songs.Type.UNVERIFIED])
+        with metrics.timer("midibot_autocomplete_seconds", callback="song_search_unverified"):
+            return await self.autocomplete(ctx, "song_search_unverified", [Songs.Type.UNVERIFIED])
     
     async def song_search_requested(self, ctx: discord.AutocompleteContext):
-        return await self.songs.song_search(ctx.value, types=[Songs.Type.REQUESTED])
+        with metrics.timer("midibot_autocomplete_seconds", callback="song_search_requested"):
+            return await self.autocomplete(ctx, "song_search_requested", [Songs.Type.REQUESTED])
     
     async def song_search_no_requests(self, ctx: discord.AutocompleteContext):
-        return await self.songs.song_search(ctx.value, types=[Songs.Type.VERIFIED, Songs.Type.UNVERIFIED])
+        with metrics.timer("midibot_autocomplete_seconds", callback="song_search_no_requests"):
+            return await self.autocomplete(ctx, "song_search_no_requests", [Songs.Type.VERIFIED, Songs.Type.UNVERIFIED])
+    
+    async def song_search_download(self, ctx: discord.AutocompleteContext):
+        with metrics.timer("midibot_autocomplete_seconds", callback="song_search_download"):
+            return await self.autocomplete(ctx, "song_search_download", [Songs.Type.VERIFIED, Songs.Type.UNVERIFIED], fallback=True)
     
     async def wrong_server(self, ctx) -> bool:
-        if ctx.guild.id not in servers:
+        if ctx.guild is None or self.config.guild(ctx.guild.id) is None:
             await ctx.respond(
                 "You can only use this bot on approved servers.", ephemeral=True
             )
             return True
         return False
 
-    async def get_song(self, ctx, song_str: str) -> Union[None, dict]:
-        song_obj = self.songs.get(song_str)
+    def request_quota_error(self, guild_id: int, user: int) -> Union[None, str]:
+        guild = self.config.guild(guild_id)
+        songs = self.catalogues.of(guild_id)
+
+        if songs.request_count() > guild.max_requests:
+            return "There are currently too many requests in the queue. Please wait until some have been fulfilled before adding more."
+
+        if songs.requests_for_user(user) >= guild.max_requests_per_user:
+            return f"To allow all users to put in requests we only allow {guild.max_requests_per_user} open requests per user. When your open requests have been handled you can add more."
+
+        return None
+
+    def banned_origin_error(self, guild_id: int, origin: str) -> Union[None, str]:
+        # paths differing only in case still point to the same banned site
+        origin = self.catalogues.shared.normalise_origin(origin).lower()
+        for prefix, description in self.config.guild(guild_id).banned_origins.items():
+            if origin.startswith(prefix.lower()):
+                return f"Oh buggers. You tried adding a request for {description}. " + \
+                    "These can't be downloaded *at all* so there's no way for our volunteers to grab it for you! :slight_frown:\n" + \
+                    "Your request hasn't been saved, feel free to put in a new request with another origin/url."
+        return None
+
+    async def get_song(self, ctx, song_str: str) -> Union[None, Song]:
+        song_obj = self.catalogues.of(ctx.guild_id).get(song_str)
 
         if song_obj == None:
             await ctx.respond("I don't know that song?", ephemeral=True)
         return song_obj
 
+    async def list_pages(self, songs: Songs, filter: str) -> list[dict]:
+        if (cached := self.list_cache.get((songs.directory, filter))) and cached[0] == songs.generation:
+            return cached[1]
+
+        await self.get_emoji()
+
+        pages = []
+        list = ""
+
+        for song in songs.by_rating(filter):
+            attachments = songs.has_attachments(song)
+
+            ext = ""
+            ext += (
+                self.emoji["Musescore"]
+                if Songs.File.MUSESCORE in attachments
+                else ":black_large_square:"
+            )
+            ext += (
+                self.emoji["Midi"]
+                if Songs.File.MIDI in attachments
+                else ":black_large_square:"
+            )
+            ext += (
+                self.emoji["PV"]
+                if Songs.File.PIANOVISION in attachments
+                else ":black_large_square:"
+            )
+
+            duration = ""
+            if info := songs.midi_info(song):
+                duration = f' [{self.format_duration(info["duration"])}]'
+
+            line = f'{song.rating} {ext} : {songs.song_to_string(song)}{duration}\n'
+
+            if len(list) + len(line) > message_limit:
+                pages.append({"content": list})
+                list = ""
+            list += line
+
+        if list:
+            pages.append({"content": list})
+
+        self.list_cache[(songs.directory, filter)] = (songs.generation, pages)
+        return pages
+
     @slash_command()
     async def download(
         self,
@@ -57,26 +243,81 @@ class Commands(Cog):
         song: Option(
             str,
             "Song",
-            autocomplete=song_search_no_requests,
+            autocomplete=song_search_download,
         ),
     ):
         """Download files for a song."""
-        if not (song_obj := await self.get_song(ctx, song)):
+        songs, song_obj = self.catalogues.get(ctx.guild_id, song)
+        if song_obj is None:
+            await ctx.respond("I don't know that song?", ephemeral=True)
             return
 
-        (files, attachements) = self.songs.get_attachements(song_obj)
+        attachements = songs.get_attachements(song_obj)
 
-        if len(attachements) > 0:
-            embed = await self.create_embed(song_obj)
-            await ctx.respond(embeds=[embed], files=attachements)
-        else:
-            await ctx.respond(
-                "No files attached to that song, use /upload to add them.",
-                ephemeral=True,
-            )
+        try:
+            if len(attachements) > 0:
+                embed = await self.create_embed(songs, song_obj)
+                await ctx.respond(embeds=[embed], files=attachements)
+            else:
+                await ctx.respond(
+                    "No files attached to that song, use /upload to add them.",
+                    ephemeral=True,
+                )
+        finally:
+            for f in attachements:
+                f.close()
 
-        for f in files:
-            os.remove(f)
+    @slash_command()
+    async def download_bundle(
+        self,
+        ctx: discord.ApplicationContext,
+        song: Option(str, "Song", autocomplete=song_search_download),
+        song2: Option(str, "Song", autocomplete=song_search_download, required=False),
+        song3: Option(str, "Song", autocomplete=song_search_download, required=False),
+        song4: Option(str, "Song", autocomplete=song_search_download, required=False),
+        song5: Option(str, "Song", autocomplete=song_search_download, required=False),
+        formats: Option(str, "Files to include", choices=list(bundle_formats), default="all"),
+    ):
+        """Download the files of several songs as one zip file."""
+        names = list(dict.fromkeys(name for name in (song, song2, song3, song4, song5) if name))
+
+        entries = {}
+        for name in names:
+            songs, song_obj = self.catalogues.get(ctx.guild_id, name)
+            if song_obj is None:
+                await ctx.respond(f"I don't know {name}?", ephemeral=True)
+                return
+            for entry in songs.bundle_entries(song_obj, bundle_formats[formats]):
+                entries.setdefault(entry[0], entry)
+
+        limit = ctx.guild.filesize_limit if ctx.guild else default_filesize_limit
+        parts, too_big = bundles.split(sorted(entries.values()), limit)
+        skipped = f"\nToo big to send here: {', '.join(too_big)}" if too_big else ""
+        if not parts:
+            error = "Those files are too big to send here." if too_big else "No files attached to those songs, use /upload to add them."
+            await ctx.respond(error, ephemeral=True)
+            return
+
+        await ctx.defer()
+        for i, part in enumerate(parts, 1):
+            key = BundleCache.key(part)
+            if (content := self.bundle_cache.get(key)) is None:
+                metrics.count("midibot_bundle_cache_total", result="miss")
+                try:
+                    content = await asyncio.to_thread(bundles.build, part)
+                except FileNotFoundError:
+                    # removed while the response was deferred
+                    await ctx.respond("Some of those files were just removed, please try again.", ephemeral=True)
+                    return
+                self.bundle_cache.put(key, content)
+            else:
+                metrics.count("midibot_bundle_cache_total", result="hit")
+
+            if len(parts) == 1:
+                message, filename = f"{', '.join(names)}{skipped}", "songs.zip"
+            else:
+                message, filename = f"{', '.join(names)} (part {i} of {len(parts)}){skipped}", f"songs-{i}-of-{len(parts)}.zip"
+            await ctx.respond(message[:message_limit], file=discord.File(io.BytesIO(content), filename=filename))
 
     @slash_command()
     @guild_only()
@@ -85,11 +326,12 @@ class Commands(Cog):
         """Add a new song to the database."""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
 
         async def add_new_song(interaction: discord.Interaction, data: dict):
             data["added_by"] = ctx.author.id
             data["type"] = Songs.Type.VERIFIED
-            if error := self.songs.add_song(data):
+            if error := songs.add_song(data):
                 await interaction.response.send_message(error, ephemeral=True)
                 return
 
@@ -104,30 +346,25 @@ class Commands(Cog):
         """Request a song."""
         if await self.wrong_server(ctx):
             return
-        
-        if self.songs.request_count() > 50:
-            await ctx.respond("There are currently too many requests in the queue. Please wait until some have been fulfilled before adding more.", ephemeral=True)
-            return
-        
-        if self.songs.requests_for_user(ctx.author.id) > 1:
-            await ctx.respond("To allow all users to put in requests we only allow two open requests per user. When your open requests have been handled you can add more.", ephemeral=True)
+        songs = self.catalogues.of(ctx.guild_id)
+
+        if error := self.request_quota_error(ctx.guild_id, ctx.author.id):
+            await ctx.respond(error, ephemeral=True)
             return
 
         async def add_new_song(interaction: discord.Interaction, data: dict):
+            if error := self.request_quota_error(ctx.guild_id, ctx.author.id):
+                await interaction.response.send_message(error, ephemeral=True)
+                return
+
             data["requested_by"] = ctx.author.id
             data["type"] = Songs.Type.REQUESTED
 
-            sad_message = "These can't be downloaded *at all* so there's no way for our volunteers to grab it for you! :slight_frown:\nYour request hasn't been saved, feel free to put in a new request with another origin/url."
-
-            if data["origin"].startswith("https://musescore.com/official_scores/") or data["origin"].startswith("https://musescore.com/official_author/"):
-                await interaction.response.send_message("Oh buggers. You tried adding a request for an \"Official Score\" on musescore. "+sad_message, ephemeral=True)
-                return
-            
-            if data["origin"].startswith("https://www.musicnotes.com/") or data["origin"].startswith("https://musicnotes.com/"):
-                await interaction.response.send_message("Oh buggers. You tried adding a request for a score on Musicnotes. "+sad_message, ephemeral=True)
+            if error := self.banned_origin_error(ctx.guild_id, data["origin"]):
+                await interaction.response.send_message(error, ephemeral=True)
                 return
 
-            if error := self.songs.add_song(data):
+            if error := songs.add_song(data):
                 await interaction.response.send_message(error, ephemeral=True)
                 return
             
@@ -137,7 +374,7 @@ class Commands(Cog):
                 " If you didn't check MuseScore, do so next time to help our midi-searching volunteers out :heart:."
 
             await interaction.response.send_message(
-                f'Song "{self.songs.song_to_string(data)}" {link}requested by <@{ctx.author.id}>.{nag}'
+                f'Song "{songs.song_to_string(data)}" {link}requested by <@{ctx.author.id}>.{nag}'
             )
 
         modal = SongModal(add_new_song, title="Request a song")
@@ -158,16 +395,19 @@ class Commands(Cog):
         """Edit an existing song."""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
 
+        stamp = songs.stamp(song_obj)
+
         async def update_song(interaction: discord.Interaction, data: dict):
-            if error := self.songs.update(song_obj, data):
+            if error := songs.update(song_obj, data, stamp):
                 await interaction.response.send_message(error, ephemeral=True)
                 return
             await interaction.response.send_message("Song updated", ephemeral=True)
 
-        modal = SongModal(update_song, song_obj, title="Edit song")
+        modal = SongModal(update_song, song_obj.to_dict(), title="Edit song")
         await ctx.send_modal(modal)
 
     @slash_command()
@@ -187,43 +427,52 @@ class Commands(Cog):
         """Upload files for a song."""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
-        
-        if origin and origin != song_obj["origin"]:
-            update_data = {
-                "artist": song_obj["artist"],
-                "song": song_obj["song"],
-                "origin": origin
-            }
-            if error := self.songs.update(song_obj, update_data):
+
+        async with songs.transaction(song_obj) as error:
+            if error:
                 await ctx.respond(error, ephemeral=True)
                 return
 
-        was_requested = song_obj["type"] == Songs.Type.REQUESTED
+            if origin and origin != song_obj.origin:
+                update_data = {
+                    "artist": song_obj.artist,
+                    "song": song_obj.song,
+                    "origin": origin
+                }
+                if error := songs.update(song_obj, update_data):
+                    await ctx.respond(error, ephemeral=True)
+                    return
 
-        if error := await self.songs.add_attachment(song_obj, file):
-            await ctx.respond(error, ephemeral=True)
-            return
-
-        if (
-            was_requested
-            and song_obj["type"] == Songs.Type.UNVERIFIED
-            and "requested_by" in song_obj
-        ):
-            (files, attachements) = self.songs.get_attachements(song_obj)
+            was_requested = song_obj.type == Songs.Type.REQUESTED
 
-            embed = await self.create_embed(song_obj)
+            if error := await songs.add_attachment(song_obj, file):
+                await ctx.respond(error, ephemeral=True)
+                return
 
-            await ctx.respond(
-                f"Hey <@{song_obj['requested_by']}>, your song has been uploaded by <@{ctx.author.id}>!\n"+
-                "Make sure to use `/verify` if you have tested it on a piano and it works!",
-                embeds=[embed],
-                files=attachements
+            fulfilled = (
+                was_requested
+                and song_obj.type == Songs.Type.UNVERIFIED
+                and song_obj.requested_by is not None
             )
 
-            for f in files:
-                os.remove(f)
+        if fulfilled:
+            attachements = songs.get_attachements(song_obj)
+
+            try:
+                embed = await self.create_embed(songs, song_obj)
+
+                await ctx.respond(
+                    f"Hey <@{song_obj.requested_by}>, your song has been uploaded by <@{ctx.author.id}>!\n"+
+                    "Make sure to use `/verify` if you have tested it on a piano and it works!",
+                    embeds=[embed],
+                    files=attachements
+                )
+            finally:
+                for f in attachements:
+                    f.close()
         else:
             await ctx.respond(f"File added or replaced", ephemeral=True)
 
@@ -242,10 +491,15 @@ class Commands(Cog):
         """Remove a song and all accompanying files"""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
 
-        if not self.songs.remove(song_obj):
+        async with songs.transaction(song_obj):
+            removed = songs.remove(song_obj)
+
+        self.embed_cache.pop(song_obj.id, None)
+        if not removed:
             await ctx.respond("I don't know that song?", ephemeral=True)
         else:
             await ctx.respond("Song removed", ephemeral=True)
@@ -266,13 +520,18 @@ class Commands(Cog):
         """Decline a request for a song"""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
 
-        if not self.songs.remove(song_obj):
+        async with songs.transaction(song_obj):
+            removed = songs.remove(song_obj)
+
+        self.embed_cache.pop(song_obj.id, None)
+        if not removed:
             await ctx.respond("I don't know that song?", ephemeral=True)
-        elif "requested_by" in song_obj:
-            await ctx.respond(f"Hey <@{song_obj['requested_by']}>. Your request '{song}' has been removed from the Queue by <@{ctx.author.id}> because of the following reason:\n{reason}")
+        elif song_obj.requested_by is not None:
+            await ctx.respond(f"Hey <@{song_obj.requested_by}>. Your request '{song}' has been removed from the Queue by <@{ctx.author.id}> because of the following reason:\n{reason}")
         else:
             await ctx.respond("Song removed, no requester found", ephemeral=True)
 
@@ -291,10 +550,13 @@ class Commands(Cog):
         """Rate a song"""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
 
-        self.songs.rate(song_obj, ctx.author.id, rating)
+        if not songs.rate(song_obj, ctx.author.id, rating):
+            await ctx.respond("I don't know that song?", ephemeral=True)
+            return
         await ctx.respond("Your rating has been added, thanks!", ephemeral=True)
 
     @slash_command()
@@ -313,47 +575,15 @@ class Commands(Cog):
         if await self.wrong_server(ctx):
             return
 
-        def songsorter(song: dict):
-            return song.get("rating", float(0))
-        
-        await self.get_emoji()
-
-        sorted = self.songs.songs.data.copy()
-        sorted = [x for x in sorted if x["type"] == filter]
-        sorted.sort(key=songsorter, reverse=True)
+        pages = await self.list_pages(self.catalogues.of(ctx.guild_id), filter)
 
-        chunk_size = 10
-
-        chunked = [
-            sorted[i : i + chunk_size] for i in range(0, len(sorted), chunk_size)
-        ]
-
-        for songs in chunked:
-            list = ""
-
-            for song in songs:
-                attachments = self.songs.has_attachments(song)
-
-                ext = ""
-                ext += (
-                    self.emoji["Musescore"]
-                    if Songs.File.MUSESCORE in attachments
-                    else ":black_large_square:"
-                )
-                ext += (
-                    self.emoji["Midi"]
-                    if Songs.File.MIDI in attachments
-                    else ":black_large_square:"
-                )
-                ext += (
-                    self.emoji["PV"]
-                    if Songs.File.PIANOVISION in attachments
-                    else ":black_large_square:"
-                )
-
-                list += f'{song.get("rating", float(0))} {ext} : {self.songs.song_to_string(song)}\n'
-
-            await ctx.respond(list, ephemeral=True)
+        if not pages:
+            await ctx.respond(f"There are no {filter} songs yet.", ephemeral=True)
+        elif len(pages) == 1:
+            await ctx.respond(**pages[0], ephemeral=True)
+        else:
+            paginator = Paginator(pages)
+            await ctx.respond(**paginator.first_page, view=paginator, ephemeral=True)
 
     @slash_command()
     @guild_only()
@@ -369,21 +599,8 @@ class Commands(Cog):
         if await self.wrong_server(ctx):
             return
 
-        sorted = [
-            x
-            for x in self.songs.songs.data
-            if x["type"] == Songs.Type.REQUESTED and x["origin"] and x["origin"].startswith("https://musescore.com/")
-        ]
-        sorted += [
-            x
-            for x in self.songs.songs.data
-            if x["type"] == Songs.Type.REQUESTED and x["origin"] and not x["origin"].startswith("https://musescore.com/")
-        ]
-        sorted += [
-            x
-            for x in self.songs.songs.data
-            if x["type"] == Songs.Type.REQUESTED and not x["origin"]
-        ]
+        songs = self.catalogues.of(ctx.guild_id)
+        sorted = [x for x in songs.open_requests()]
 
         if not sorted:          
             embeds = [discord.Embed(title=f'The request queue is empty. Thanks for checking!', type="rich")]
@@ -395,17 +612,16 @@ class Commands(Cog):
 
         chunk_size = 10
 
-        chunked = [
-            sorted[i : i + chunk_size] for i in range(0, len(sorted), chunk_size)
+        pages = [
+            {"embeds": [await self.create_embed(songs, song) for song in sorted[i : i + chunk_size]]}
+            for i in range(0, len(sorted), chunk_size)
         ]
 
-        for songs in chunked:
-            embeds = []
-
-            for song in songs:
-                embeds.append(await self.create_embed(song))
-
-            await ctx.respond(embeds=embeds,ephemeral=True)
+        if len(pages) == 1:
+            await ctx.respond(**pages[0], ephemeral=True)
+        else:
+            paginator = Paginator(pages)
+            await ctx.respond(**paginator.first_page, view=paginator, ephemeral=True)
 
     @slash_command()
     @guild_only()
@@ -421,12 +637,74 @@ class Commands(Cog):
         """Verify a song is playable on piano."""
         if await self.wrong_server(ctx):
             return
+        songs = self.catalogues.of(ctx.guild_id)
         if not (song_obj := await self.get_song(ctx, song)):
             return
         
-        self.songs.verify(song_obj)
+        async with songs.transaction(song_obj) as error:
+            if error or (error := songs.verify(song_obj)):
+                await ctx.respond(error, ephemeral=True)
+                return
 
-        await ctx.respond(f"<@{ctx.author.id}> has verified that `{self.songs.song_to_string(song_obj)}` is playable on piano! Thanks!")
+        await ctx.respond(f"<@{ctx.author.id}> has verified that `{songs.song_to_string(song_obj)}` is playable on piano! Thanks!")
+
+    @slash_command()
+    @guild_only()
+    @default_permissions(administrator=True)
+    async def import_songs(
+        self,
+        ctx: discord.ApplicationContext,
+        bundle: discord.Attachment,
+    ):
+        """Add the songs of a zip file with a songs.jsonl or songs.csv manifest and their files."""
+        if await self.wrong_server(ctx):
+            return
+        songs = self.catalogues.of(ctx.guild_id)
+        await ctx.defer(ephemeral=True)
+
+        tmp = songs.blobs.temp_path()
+        try:
+            if error := await ingest.download(bundle.url, tmp, self.config.max_import_size):
+                await ctx.respond(error, ephemeral=True)
+                return
+
+            importer = Importer(songs, self.config.analysis_workers, self.config.max_attachment_size, {"added_by": ctx.author.id})
+            report = await importer.run(tmp)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        await ctx.respond(report.summary(limit=10)[:message_limit], ephemeral=True)
+        await songs.analyse_missing()
+
+    @slash_command()
+    @guild_only()
+    @default_permissions(administrator=True)
+    async def export_songs(self, ctx: discord.ApplicationContext):
+        """Download all songs and their files as a zip file /import_songs can read."""
+        if await self.wrong_server(ctx):
+            return
+        songs = self.catalogues.of(ctx.guild_id)
+        await ctx.defer(ephemeral=True)
+
+        tmp = f"{songs.blobs.temp_path()}.zip"
+        try:
+            count = await asyncio.to_thread(Exporter(songs).run, tmp)
+            if os.path.getsize(tmp) > ctx.guild.filesize_limit:
+                await ctx.respond(
+                    "The export is too big to send here, use `python -m midibot.bulk export` on the bot's server instead.",
+                    ephemeral=True,
+                )
+                return
+
+            file = discord.File(tmp, filename="songs.zip")
+            try:
+                await ctx.respond(f"All {count} songs", file=file, ephemeral=True)
+            finally:
+                file.close()
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
 
     @slash_command()
     @guild_only()
@@ -441,27 +719,32 @@ class Commands(Cog):
             "*The following commands are available:*\n"+
             "`/list`: List songs in Midibot, by default only shows verified songs but you can change the filter option if you want.\n"+
             "`/download`: Download a song, start typing in the song option to find the song you are looking for.\n"+
+            "`/download_bundle`: Download up to five songs at once as a zip file.\n"+
             "`/request`: Request a song. Adding a MuseScore URL gives you priority over songs that don't have an URL.\n"+
             "`/open_requests`: View all open requests, the ones listed first have been waiting the longest.\n"+
             "`/upload`: Upload midi, MuseScore or PianoVision json files for a song.\n"+
             "`/verify`: Verify that an uploaded song is playable on piano.\n"+
             "`/add`: Add a song to the MidiBot database, I'll assume you have verified it works. Add the files afterwards with `/upload`.\n"+
+            "`/import_songs`, `/export_songs`: Add many songs at once from a zip file, or download all songs as one.\n"+
             "`/rate`: Give a song a rating from 0-5. Songs with higher ratings appear higher in the `/list`."
         )
 
-    async def create_embed(self, song):
+    async def create_embed(self, songs: Songs, song: Song):
+        revision = songs.revision(song)
+        if (cached := self.embed_cache.get(song.id)) and cached[0] == revision:
+            return cached[1]
 
         await self.get_emoji()
 
         desc = []
-        embed = discord.Embed(title=f'{song["artist"]} - {song["song"]}', type="rich")
-        if song["version"] != "":
-            desc.append(song["version"])
-        if song["origin"]:
-            desc.append(song["origin"])
+        embed = discord.Embed(title=f'{song.artist} - {song.song}', type="rich")
+        if song.version != "":
+            desc.append(song.version)
+        if song.origin:
+            desc.append(song.origin)
         embed.description = "\n".join(desc)
 
-        attachments = self.songs.has_attachments(song)
+        attachments = songs.has_attachments(song)
 
         if len(attachments) > 0:
             ext = []
@@ -473,16 +756,32 @@ class Commands(Cog):
                 ext.append(self.emoji["PV"])
             embed.add_field(name="Files", value=" ".join(ext))
 
-        if "requested_by" in song:
-            embed.add_field(name="Requested by", value=f'<@{song["requested_by"]}>')
+        if info := songs.midi_info(song):
+            embed.add_field(name="Midi", value=self.midi_summary(info))
+
+        if song.requested_by is not None:
+            embed.add_field(name="Requested by", value=f'<@{song.requested_by}>')
 
-        if song['type'] == Songs.Type.VERIFIED:
+        if song.type == Songs.Type.VERIFIED:
             embed.add_field(name="Verified", value=':white_check_mark:')
-        if song['type'] == Songs.Type.UNVERIFIED:
+        if song.type == Songs.Type.UNVERIFIED:
             embed.add_field(name="Verified", value=':x:')
 
+        self.embed_cache[song.id] = (revision, embed)
         return embed
     
+    def format_duration(self, seconds: float) -> str:
+        minutes, seconds = divmod(round(seconds), 60)
+        return f"{minutes}:{seconds:02}"
+
+    def midi_summary(self, info: dict) -> str:
+        summary = f'{info["tracks"]} tracks, {info["notes"]} notes, {self.format_duration(info["duration"])}, {info["tempo"]} bpm'
+        if info["lowest"] is not None:
+            summary += f', {note_name(info["lowest"])} - {note_name(info["highest"])}'
+        if not info["pianovision"]:
+            summary += "\nHas more than 2 tracks, PianoVision can't use it"
+        return summary
+
     async def get_emoji(self):
         if len(self.emoji) < 3:
             self.emoji["Midi"] = str(discord.utils.get(self.bot.emojis, name='Midi'))
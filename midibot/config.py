@@ -1,4 +1,98 @@
+import os
+from typing import Union
+
+import yaml
+
+default_guilds = [1004388945422987304, 908282497769558036, 1206713211139792996]
+
+
+class GuildConfig:
+    """Settings for one guild, falling back to the top level settings."""
+
+    def __init__(self, id: int, settings: dict, defaults: dict):
+        self.id = id
+        self.settings = settings or {}
+        self.defaults = defaults
+
+    def __get(self, key: str, default):
+        return self.settings.get(key, self.defaults.get(key, default))
+
+    @property
+    def own_catalogue(self) -> bool:
+        """Whether the guild keeps its songs in data/guilds/<id> instead of the shared catalogue."""
+        return bool(self.settings.get("own_catalogue", False))
+
+    @property
+    def max_requests(self) -> int:
+        return int(self.__get("max_requests", 50))
+
+    @property
+    def max_requests_per_user(self) -> int:
+        return int(self.__get("max_requests_per_user", 2))
+
+    @property
+    def banned_origins(self) -> dict[str, str]:
+        return self.__get("banned_origins", {
+            "musescore.com/official_scores/": 'an "Official Score" on musescore',
+            "musescore.com/official_author/": 'an "Official Score" on musescore',
+            "musicnotes.com/": "a score on Musicnotes",
+        })
+
+
 class Config:
-    def __init__(self):
-        with open('data/bot.token', 'r') as file:
-            self.token = file.read().strip()
+    def __init__(self, file: str = "data/config.yaml"):
+        # everything the bot stores lives next to its config file
+        self.directory = os.path.dirname(file) or "."
+        self.settings: dict = {}
+
+        if os.path.exists(file):
+            with open(file, 'r') as settings:
+                self.settings = yaml.safe_load(settings) or {}
+
+        guilds = self.settings.get("guilds", dict.fromkeys(default_guilds))
+        self.guilds: dict[int, GuildConfig] = {
+            int(id): GuildConfig(int(id), settings, self.settings)
+            for id, settings in guilds.items()
+        }
+
+    def guild(self, id: int) -> Union[None, GuildConfig]:
+        """Settings of an allowed guild, None for guilds the bot shouldn't be used in."""
+        return self.guilds.get(id)
+
+    @property
+    def token(self) -> str:
+        with open(f"{self.directory}/bot.token", 'r') as file:
+            return file.read().strip()
+
+    @property
+    def sync_delay(self) -> float:
+        return float(self.settings.get("sync_delay", 2.0))
+
+    @property
+    def storage(self) -> str:
+        return self.settings.get("storage", "json")
+
+    @property
+    def max_attachment_size(self) -> int:
+        return int(self.settings.get("max_attachment_size", 10 * 1024 * 1024))
+
+    @property
+    def max_import_size(self) -> int:
+        return int(self.settings.get("max_import_size", 100 * 1024 * 1024))
+
+    @property
+    def bundle_cache_size(self) -> int:
+        return int(self.settings.get("bundle_cache_size", 64 * 1024 * 1024))
+
+    @property
+    def analysis_workers(self) -> int:
+        return int(self.settings.get("analysis_workers", 2))
+
+    @property
+    def metrics_host(self) -> str:
+        return self.settings.get("metrics_host", "127.0.0.1")
+
+    @property
+    def metrics_port(self) -> Union[None, int]:
+        port = self.settings.get("metrics_port")
+        return None if port is None else int(port)
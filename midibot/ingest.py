@@ -0,0 +1,69 @@
+import json
+import zipfile
+from typing import Union
+
+import aiohttp
+from mido import MidiFile
+
+chunk_size = 64 * 1024
+
+magic = {
+    ".mid": (b"MThd",),
+    ".mscz": (b"PK\x03\x04",),
+    ".json": (b"{", b"["),
+}
+
+
+async def download(url: str, file: str, limit: int, digest=None) -> Union[None, str]:
+    too_big = f"That file is too big, files can be at most {limit // (1024 * 1024)} MB."
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            if response.status != 200:
+                return f"I couldn't download that file from Discord ({response.status}), please try again."
+            if response.content_length and response.content_length > limit:
+                return too_big
+
+            size = 0
+            with open(file, "wb") as out:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    size += len(chunk)
+                    if size > limit:
+                        return too_big
+                    out.write(chunk)
+                    if digest:
+                        digest.update(chunk)
+
+    return None
+
+
+def sniff(file: str) -> Union[None, str]:
+    with open(file, "rb") as f:
+        head = f.read(64).removeprefix(b"\xef\xbb\xbf").lstrip()
+
+    for ext, prefixes in magic.items():
+        if head.startswith(prefixes):
+            return ext
+    return None
+
+
+def validate(file: str, ext: str) -> Union[None, str]:
+    """Check that ``file`` really holds an ``ext`` file, blocks so run it in a worker thread."""
+    if sniff(file) != ext:
+        return f"That file doesn't look like a {ext} file."
+
+    try:
+        if ext == ".mid":
+            MidiFile(file)
+        elif ext == ".mscz":
+            with zipfile.ZipFile(file) as mscz:
+                if not any(name.endswith(".mscx") for name in mscz.namelist()) or mscz.testzip():
+                    return "That MuseScore file seems to be damaged."
+        elif ext == ".json":
+            with open(file, "r", encoding="utf-8-sig") as pv:
+                if not isinstance(json.load(pv), dict):
+                    return "That json file isn't a PianoVision file."
+    except Exception:
+        return f"That {ext} file seems to be damaged, I couldn't read it."
+
+    return None
@@ -0,0 +1,159 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+
+from midibot import Store
+from midibot.metrics import registry as metrics
+
+_log = logging.getLogger(__name__)
+
+
+class JournalStore(Store[list]):
+    """Store for a list of items with an "id" key that appends every change to
+    a log next to the snapshot file, only rewriting the snapshot when compacting.
+
+    Compaction rotates the log away and copies the list in the same step, so
+    records written while the snapshot is being written are never lost and
+    never half in it. Replaying a record twice is harmless, which makes a
+    crash at any point recoverable.
+    """
+
+    def __init__(self, file: str, compact_every: int = 1000):
+        super().__init__(file, [])
+        self.__log_file = f"{file}.log"
+        self.__compact_every = compact_every
+        self.__compacting = False
+        self.__pending = False
+        self.__compactor: asyncio.Task = None
+
+        self.__records = self.__replay()
+        self.__log = open(self.__log_file, "a")
+
+        if self.__records:
+            self.compact()
+
+    def sync(self):
+        self.compact()
+
+    def changed(self, item, *keys: str):
+        if self.batching:
+            return
+        item = self.encode(item)
+        if keys:
+            fields = {key: self.__lookup(item, key) for key in keys}
+            self.__append({"op": "set", "id": item["id"], "fields": fields})
+        else:
+            self.__append({"op": "put", "item": item})
+
+    def removed(self, item):
+        if self.batching:
+            return
+        self.__append({"op": "del", "id": self.encode(item)["id"]})
+
+    def close(self):
+        self.__log.close()
+
+    def flush(self):
+        self.__snapshot(*self.__rotate())
+
+    def compact(self):
+        if self.__compacting:
+            self.__pending = True
+            return
+
+        rotated, data = self.__rotate()
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.__snapshot(rotated, data)
+            return
+
+        self.__compacting = True
+        self.__compactor = loop.create_task(self.__compact_in_background(rotated, data))
+
+    async def __compact_in_background(self, rotated: list[str], data: list):
+        try:
+            await asyncio.to_thread(self.__snapshot, rotated, data)
+        finally:
+            self.__compacting = False
+
+        if self.__pending:
+            self.__pending = False
+            self.compact()
+
+    def __rotate(self) -> tuple[list[str], list]:
+        """Start a new log, returns the logs and the copy of the data the snapshot replaces them with."""
+        self.__log.close()
+        os.replace(self.__log_file, f"{self.__log_file}.{time.time_ns()}")
+        self.__log = open(self.__log_file, "a")
+        self.__records = 0
+        return self.__rotated(), self._snapshot()
+
+    def __snapshot(self, rotated: list[str], data: list):
+        self._write(data)
+        for log in rotated:
+            os.remove(log)
+
+    def __rotated(self) -> list[str]:
+        logs = glob.glob(f"{glob.escape(self.__log_file)}.*")
+        logs = [log for log in logs if log.rsplit(".", 1)[1].isdigit()]
+        return sorted(logs, key=lambda log: int(log.rsplit(".", 1)[1]))
+
+    def __append(self, record: dict):
+        with metrics.timer("midibot_store_sync_seconds", file=self.__log_file):
+            line = json.dumps(record) + "\n"
+            self.__log.write(line)
+            self.__log.flush()
+            os.fsync(self.__log.fileno())
+        metrics.count("midibot_store_written_bytes_total", len(line), file=self.__log_file)
+
+        self.__records += 1
+        if self.__records >= self.__compact_every:
+            self.compact()
+
+    def __replay(self) -> int:
+        items = {item["id"]: item for item in self.data}
+        records = 0
+
+        for log in self.__rotated() + [self.__log_file]:
+            if not os.path.exists(log):
+                continue
+
+            with open(log, "r") as file:
+                for line in file:
+                    records += 1
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        _log.warning(f"Ignoring damaged record at the end of '{log}'")
+                        break
+                    self.__apply(items, record)
+
+        self.data = list(items.values())
+        return records
+
+    def __apply(self, items: dict[str, dict], record: dict):
+        if record["op"] == "put":
+            items[record["item"]["id"]] = record["item"]
+        elif record["op"] == "del":
+            items.pop(record["id"], None)
+        elif record["op"] == "set" and (item := items.get(record["id"])) is not None:
+            for key, value in record["fields"].items():
+                self.__assign(item, key, value)
+
+    def __lookup(self, item: dict, key: str):
+        for part in key.split("."):
+            if not isinstance(item, dict):
+                return None
+            item = item.get(part)
+        return item
+
+    def __assign(self, item: dict, key: str, value):
+        *parents, last = key.split(".")
+        for part in parents:
+            item = item.setdefault(part, {})
+        item[last] = value
@@ -0,0 +1,342 @@
+"""Drive the Commands cog in-process with simulated users.
+
+    python -m midibot.loadtest --songs 10000 --users 300 --actions 20
+
+Interactions are delivered through stand-ins for the discord contexts, so no
+gateway connection or token is needed. Uploaded files are served from memory
+by a local HTTP server. The report shows end to end latency per command and
+how long the event loop was blocked while the users were active.
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import random
+import tempfile
+import time
+
+from aiohttp import web
+import mido
+import yaml
+
+from midibot.bench import Catalogue, Result
+
+
+class FakeUser:
+    def __init__(self, id: int):
+        self.id = id
+        self.mention = f"<@{id}>"
+
+
+class FakeGuild:
+    def __init__(self, id: int):
+        self.id = id
+
+
+class FakeResponse:
+    """Stands in for ``discord.InteractionResponse``, remembers the first response."""
+
+    def __init__(self, interaction: "FakeInteraction"):
+        self.interaction = interaction
+        self.modal = None
+
+    async def send_message(self, content: str = None, **kwargs):
+        self.interaction.responded(content, kwargs)
+
+    async def edit_message(self, content: str = None, **kwargs):
+        self.interaction.responded(content, kwargs)
+
+    async def send_modal(self, modal):
+        self.modal = modal
+        self.interaction.responded(None, {"modal": modal})
+
+
+class FakeInteraction:
+    ids = itertools.count(1)
+
+    def __init__(self, user: FakeUser, guild: FakeGuild):
+        self.id = next(FakeInteraction.ids)
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+        self.response = FakeResponse(self)
+        self.messages: list[tuple[str, dict]] = []
+        self.first_response: float = None
+
+    def responded(self, content: str, kwargs: dict):
+        if self.first_response is None:
+            self.first_response = time.perf_counter()
+        self.messages.append((content, kwargs))
+
+
+class FakeCommand:
+    def __init__(self, name: str):
+        self.name = name
+        self.qualified_name = name
+
+
+class FakeContext:
+    """Stands in for ``discord.ApplicationContext``."""
+
+    def __init__(self, command: str, user: FakeUser, guild: FakeGuild):
+        self.interaction = FakeInteraction(user, guild)
+        self.command = FakeCommand(command)
+        self.author = user
+        self.user = user
+        self.guild = guild
+        self.guild_id = guild.id
+
+    async def respond(self, content: str = None, **kwargs):
+        self.interaction.responded(content, kwargs)
+
+    async def send_modal(self, modal):
+        await self.interaction.response.send_modal(modal)
+
+    async def defer(self, **kwargs):
+        pass
+
+
+class FakeAutocompleteContext:
+    def __init__(self, value: str, user: FakeUser, guild: FakeGuild):
+        self.value = value
+        self.interaction = FakeInteraction(user, guild)
+        self.options = {}
+
+
+class FakeAttachment:
+    def __init__(self, filename: str, url: str, size: int):
+        self.filename = filename
+        self.url = url
+        self.size = size
+
+
+class FakeBot:
+    """Just enough of ``discord.Bot`` for the cog, it never becomes ready."""
+
+    def __init__(self):
+        self.emojis = []
+        self.__ready = asyncio.Event()
+
+    async def wait_until_ready(self):
+        await self.__ready.wait()
+
+
+class AttachmentServer:
+    """Serves uploaded files from memory, like Discord's CDN would."""
+
+    def __init__(self):
+        self.files: dict[str, bytes] = {}
+        self.__runner: web.AppRunner = None
+        self.port = None
+
+    async def start(self):
+        async def handle(request: web.Request) -> web.Response:
+            if (content := self.files.get(request.match_info["name"])) is None:
+                return web.Response(status=404)
+            return web.Response(body=content)
+
+        app = web.Application()
+        app.router.add_get("/{name}", handle)
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def attachment(self, filename: str, content: bytes) -> FakeAttachment:
+        name = f"{len(self.files)}-{filename}"
+        self.files[name] = content
+        return FakeAttachment(filename, f"http://127.0.0.1:{self.port}/{name}", len(content))
+
+    async def stop(self):
+        await self.__runner.cleanup()
+
+
+def midi_file(rng: random.Random) -> bytes:
+    midi = mido.MidiFile()
+    for _ in range(rng.randint(1, 3)):
+        track = mido.MidiTrack()
+        for _ in range(rng.randint(50, 500)):
+            note = rng.randint(21, 108)
+            track.append(mido.Message("note_on", note=note, velocity=64, time=rng.randint(0, 240)))
+            track.append(mido.Message("note_off", note=note, velocity=0, time=rng.randint(60, 480)))
+        midi.tracks.append(track)
+
+    out = io.BytesIO()
+    midi.save(file=out)
+    return out.getvalue()
+
+
+class StallMonitor:
+    """Measures how late the event loop wakes up from short sleeps."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stalls: list[float] = []
+        self.__task: asyncio.Task = None
+
+    def start(self):
+        self.__task = asyncio.get_running_loop().create_task(self.__run())
+
+    async def __run(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.stalls.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def stop(self):
+        self.__task.cancel()
+
+
+class LoadTest:
+    def __init__(self, cog, guild: FakeGuild, server: AttachmentServer, songs: list[dict], seed: int):
+        self.cog = cog
+        self.guild = guild
+        self.server = server
+        self.songs = songs
+        self.random = random.Random(seed)
+        self.timings: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def command(self, name: str, user: FakeUser, **options) -> FakeContext:
+        ctx = FakeContext(name, user, self.guild)
+        start = time.perf_counter()
+        await self.cog.cog_before_invoke(ctx)
+        try:
+            await getattr(self.cog, name).callback(self.cog, ctx, **options)
+        except Exception as error:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            await self.cog.on_application_command_error(ctx, error)
+        finally:
+            await self.cog.cog_after_invoke(ctx)
+        self.timings.setdefault(name, []).append((ctx.interaction.first_response or time.perf_counter()) - start)
+        return ctx
+
+    async def submit(self, name: str, ctx: FakeContext, user: FakeUser, values: list[str]):
+        modal = ctx.interaction.response.modal
+        if modal is None:
+            return
+
+        for child, value in zip(modal.children, values):
+            child.value = value
+        interaction = FakeInteraction(user, self.guild)
+        start = time.perf_counter()
+        await modal.callback(interaction)
+        self.timings.setdefault(name, []).append((interaction.first_response or time.perf_counter()) - start)
+
+    async def autocomplete(self, user: FakeUser, callback: str) -> list[str]:
+        """Type a song name letter by letter like a user would, returns the last choices."""
+        song = self.random.choice(self.songs)
+        text = f'{song["artist"]} {song["song"]}'.lower()
+        choices = []
+        for end in range(1, self.random.randint(2, min(12, len(text)) + 1)):
+            start = time.perf_counter()
+            choices = await getattr(self.cog, callback)(FakeAutocompleteContext(text[:end], user, self.guild))
+            self.timings.setdefault("autocomplete", []).append(time.perf_counter() - start)
+            await asyncio.sleep(self.random.uniform(0, 0.05))
+        return choices
+
+    async def user(self, user: FakeUser, actions: int):
+        for _ in range(actions):
+            await asyncio.sleep(self.random.uniform(0, 0.2))
+            action = self.random.choices(
+                ["download", "rate", "list", "open_requests", "request", "edit", "upload"],
+                [30, 25, 15, 10, 5, 5, 10],
+            )[0]
+
+            if action == "download":
+                if choices := await self.autocomplete(user, "song_search_download"):
+                    await self.command("download", user, song=self.random.choice(choices))
+            elif action == "rate":
+                if choices := await self.autocomplete(user, "song_search_no_requests"):
+                    await self.command("rate", user, song=self.random.choice(choices), rating=self.random.randint(0, 5))
+            elif action == "list":
+                await self.command("list", user, filter=self.random.choice(["verified", "unverified"]))
+            elif action == "open_requests":
+                await self.command("open_requests", user, amount=None)
+            elif action == "request":
+                ctx = await self.command("request", user)
+                song = Catalogue(1, self.random.getrandbits(32)).song()
+                await self.submit("request (modal)", ctx, user, [song["artist"], song["song"], song["version"], song["origin"]])
+            elif action == "edit":
+                if choices := await self.autocomplete(user, "song_search"):
+                    ctx = await self.command("edit", user, song=self.random.choice(choices))
+                    if modal := ctx.interaction.response.modal:
+                        values = [child.value for child in modal.children]
+                        values[2] = self.random.choice(["", "Piano Solo", "Easy"])
+                        await self.submit("edit (modal)", ctx, user, values)
+            elif action == "upload":
+                if choices := await self.autocomplete(user, "song_search"):
+                    attachment = self.server.attachment("song.mid", midi_file(self.random))
+                    await self.command("upload", user, song=self.random.choice(choices), file=attachment, origin=None)
+
+    def report(self, elapsed: float, stalls: list[float]):
+        print(f'{"interaction":<20}{"calls":>8}{"errors":>8}{"p50 ms":>10}{"p99 ms":>10}{"max ms":>10}')
+        for name, timings in sorted(self.timings.items()):
+            result = Result(name, timings)
+            print(
+                f"{name:<20}{len(timings):>8}{self.errors.get(name, 0):>8}"
+                f"{result.percentile(0.5) * 1e3:>10.1f}{result.percentile(0.99) * 1e3:>10.1f}{result.timings[-1] * 1e3:>10.1f}"
+            )
+
+        interactions = sum(len(timings) for timings in self.timings.values())
+        print(f"\n{interactions} interactions in {elapsed:.1f}s ({interactions / elapsed:.0f}/s)")
+        if stalls:
+            stalls = Result("stall", stalls)
+            print(
+                f"event loop stalls: p50 {stalls.percentile(0.5) * 1e3:.1f} ms, p99 {stalls.percentile(0.99) * 1e3:.1f} ms, "
+                f"max {stalls.timings[-1] * 1e3:.1f} ms, {sum(stalls.timings):.2f}s blocked in total"
+            )
+
+
+async def run(args, directory: str):
+    from midibot import Commands, Config
+    from midibot.config import default_guilds
+
+    catalogue = Catalogue(args.songs, args.seed)
+    songs = catalogue.songs()
+    catalogue.attach(songs, f"{directory}/blobs")
+    with open(f"{directory}/songs.json", "w") as file:
+        json.dump(songs, file)
+    with open(f"{directory}/config.yaml", "w") as file:
+        # the catalogue alone holds more requests than the default limits allow
+        limits = {"max_requests": 10**9, "max_requests_per_user": 10**9}
+        yaml.safe_dump({"storage": args.storage, "analysis_workers": 2, **limits}, file)
+
+    server = AttachmentServer()
+    await server.start()
+
+    cog = Commands(FakeBot(), Config(f"{directory}/config.yaml"))
+    test = LoadTest(cog, FakeGuild(default_guilds[0]), server, songs, args.seed)
+    users = [FakeUser(10**17 + i) for i in range(args.users)]
+
+    monitor = StallMonitor()
+    monitor.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(test.user(user, args.actions) for user in users))
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+
+    test.report(elapsed, monitor.stalls)
+
+    cog.reconcile_attachments.cancel()
+    cog.catalogues.close()
+    await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--actions", type=int, default=20, help="actions per user")
+    parser.add_argument("--storage", default="json", choices=["json", "journal", "sqlite"])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="midibot-loadtest-") as directory:
+        asyncio.run(run(args, directory))
+
+
+if __name__ == "__main__":
+    main()
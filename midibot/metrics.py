@@ -0,0 +1,121 @@
+import bisect
+import logging
+import threading
+import time
+
+from aiohttp import web
+
+_log = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("metrics", "name", "labels", "start")
+
+    def __init__(self, metrics: "Metrics", name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+class Metrics:
+    """Counters and latency histograms, rendered in the Prometheus text format.
+
+    Nothing is recorded until ``enabled`` is set, so the calls can stay in hot
+    paths at the cost of a single attribute check.
+    """
+
+    buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    null_timer = NullTimer()
+
+    def __init__(self):
+        self.enabled = False
+        self.__lock = threading.Lock()
+        self.__counters: dict[str, dict[tuple, float]] = {}
+        self.__histograms: dict[str, dict[tuple, list]] = {}
+        self.__runner: web.AppRunner = None
+
+    def count(self, name: str, value: float = 1, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.__lock:
+            counter = self.__counters.setdefault(name, {})
+            counter[key] = counter.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self.__lock:
+            histogram = self.__histograms.setdefault(name, {})
+            # one count per bucket, then +Inf, then the sum
+            if (values := histogram.get(key)) is None:
+                values = histogram[key] = [0] * (len(Metrics.buckets) + 1) + [0.0]
+            values[bisect.bisect_left(Metrics.buckets, seconds)] += 1
+            values[-1] += seconds
+
+    def timer(self, name: str, **labels: str):
+        """Context manager that observes how long its body took."""
+        if not self.enabled:
+            return Metrics.null_timer
+        return Timer(self, name, labels)
+
+    def render(self) -> str:
+        lines = []
+        with self.__lock:
+            for name, counter in sorted(self.__counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(counter.items()):
+                    lines.append(f"{name}{self.__labels(key)} {value}")
+
+            for name, histogram in sorted(self.__histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, values in sorted(histogram.items()):
+                    total = 0
+                    for le, count in zip(Metrics.buckets + ("+Inf",), values):
+                        total += count
+                        lines.append(f"{name}_bucket{self.__labels(key + (('le', le),))} {total}")
+                    lines.append(f"{name}_sum{self.__labels(key)} {values[-1]}")
+                    lines.append(f"{name}_count{self.__labels(key)} {total}")
+
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, host: str, port: int):
+        """Serve the metrics at http://host:port/metrics."""
+        if self.__runner is not None:
+            return
+
+        async def handle(request: web.Request) -> web.Response:
+            return web.Response(text=self.render(), content_type="text/plain")
+
+        app = web.Application()
+        app.router.add_get("/metrics", handle)
+        self.__runner = web.AppRunner(app, access_log=None)
+        await self.__runner.setup()
+        await web.TCPSite(self.__runner, host, port).start()
+        _log.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def __labels(self, key: tuple) -> str:
+        if not key:
+            return ""
+        labels = ",".join(f'{name}="{value}"' for name, value in key)
+        return f"{{{labels}}}"
+
+
+registry = Metrics()
@@ -0,0 +1,36 @@
+import discord
+
+
+class Paginator(discord.ui.View):
+    def __init__(self, pages: list[dict], *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+
+        self.__pages = pages
+        self.__page = 0
+        self.__update_buttons()
+
+    @property
+    def first_page(self) -> dict:
+        return self.__pages[0]
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await self.__show(interaction, self.__page - 1)
+
+    @discord.ui.button(label="1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def position(self, button: discord.ui.Button, interaction: discord.Interaction):
+        pass
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, button: discord.ui.Button, interaction: discord.Interaction):
+        await self.__show(interaction, self.__page + 1)
+
+    async def __show(self, interaction: discord.Interaction, page: int):
+        self.__page = max(0, min(page, len(self.__pages) - 1))
+        self.__update_buttons()
+        await interaction.response.edit_message(**self.__pages[self.__page], view=self)
+
+    def __update_buttons(self):
+        self.previous_page.disabled = self.__page == 0
+        self.next_page.disabled = self.__page == len(self.__pages) - 1
+        self.position.label = f"{self.__page + 1}/{len(self.__pages)}"
@@ -0,0 +1,164 @@
+from array import array
+import bisect
+from typing import Union
+
+
+class Ratings:
+    """Ratings per user id, kept in two parallel arrays sorted by user id with a
+    running total so the average never needs the individual ratings."""
+
+    __slots__ = ("users", "values", "total")
+
+    def __init__(self, ratings: dict = None):
+        items = sorted((int(user), int(rating)) for user, rating in (ratings or {}).items())
+        self.users = array("q", (user for user, _ in items))
+        self.values = array("b", (rating for _, rating in items))
+        self.total = sum(self.values)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    @property
+    def average(self) -> float:
+        return float(self.total) / len(self.users) if self.users else float(0)
+
+    def get(self, user: int) -> Union[None, int]:
+        i = bisect.bisect_left(self.users, user)
+        if i < len(self.users) and self.users[i] == user:
+            return self.values[i]
+        return None
+
+    def set(self, user: int, rating: int) -> Union[None, int]:
+        """Set the rating of ``user``, returns their previous rating."""
+        i = bisect.bisect_left(self.users, user)
+        if i < len(self.users) and self.users[i] == user:
+            previous = self.values[i]
+            self.values[i] = rating
+            self.total += rating - previous
+            return previous
+
+        self.users.insert(i, user)
+        self.values.insert(i, rating)
+        self.total += rating
+        return None
+
+    def to_dict(self) -> dict[str, int]:
+        return {f"{user}": rating for user, rating in zip(self.users, self.values)}
+
+
+class Song:
+    __slots__ = (
+        "id",
+        "type",
+        "artist",
+        "song",
+        "version",
+        "origin",
+        "requested_by",
+        "added_by",
+        "ratings",
+        "files",
+        "extra",
+        "display",
+    )
+
+    fields = ("artist", "song", "version", "origin")
+
+    def __init__(
+        self,
+        id: str,
+        type: str,
+        artist: str = "",
+        song: str = "",
+        version: str = "",
+        origin: str = "",
+        requested_by: int = None,
+        added_by: int = None,
+        ratings: Ratings = None,
+        files: dict[str, str] = None,
+        extra: dict = None,
+    ):
+        self.id = id
+        self.type = type
+        self.artist = artist
+        self.song = song
+        self.version = version or ""
+        self.origin = origin or ""
+        self.requested_by = requested_by
+        self.added_by = added_by
+        self.ratings = ratings
+        self.files = files
+        self.extra = extra
+        self.refresh()
+
+    @staticmethod
+    def format(artist: str, song: str, version: str = None) -> str:
+        string = f"{artist} - {song}"
+        if version:
+            string = string + f" ({version})"
+        return string
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Song":
+        extra = {
+            key: value
+            for key, value in data.items()
+            if key not in cls.__slots__ and key != "rating"
+        }
+        return cls(
+            data["id"],
+            data["type"],
+            data.get("artist", ""),
+            data.get("song", ""),
+            data.get("version"),
+            data.get("origin"),
+            data.get("requested_by"),
+            data.get("added_by"),
+            Ratings(data["ratings"]) if data.get("ratings") else None,
+            dict(data["files"]) if data.get("files") else None,
+            extra or None,
+        )
+
+    def to_dict(self) -> dict:
+        data = {
+            "id": self.id,
+            "type": self.type,
+            "artist": self.artist,
+            "song": self.song,
+            "version": self.version,
+            "origin": self.origin,
+        }
+        if self.requested_by is not None:
+            data["requested_by"] = self.requested_by
+        if self.added_by is not None:
+            data["added_by"] = self.added_by
+        if self.ratings:
+            data["rating"] = self.rating
+            data["ratings"] = self.ratings.to_dict()
+        if self.files:
+            data["files"] = dict(self.files)
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @property
+    def rating(self) -> float:
+        return self.ratings.average if self.ratings else float(0)
+
+    def update(self, data: dict):
+        for key, value in data.items():
+            if key in Song.fields:
+                setattr(self, key, value or "")
+            elif key == "ratings":
+                self.ratings = Ratings(value) if value else None
+            elif key == "rating":
+                continue
+            elif key in Song.__slots__:
+                setattr(self, key, value)
+            else:
+                self.extra = self.extra or {}
+                self.extra[key] = value
+        self.refresh()
+
+    def refresh(self):
+        self.display = Song.format(self.artist, self.song, self.version)
@@ -0,0 +1,250 @@
+import heapq
+import re
+import unicodedata
+from typing import Iterable
+
+
+def fold(text: str) -> str:
+    """Lowercase ``text`` and strip its diacritics, so "Beyoncé" matches "beyonce"."""
+    decomposed = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def distance(a: str, b: str, limit: int) -> int:
+    """Edit distance between ``a`` and ``b`` counting adjacent swaps as one edit,
+    anything above ``limit`` is returned as ``limit + 1``."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    previous = None
+    row = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        before, previous, row = previous, row, [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            row[j] = min(previous[j] + 1, row[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                row[j] = min(row[j], before[j - 2] + 1)
+        if min(row) > limit:
+            return limit + 1
+
+    return min(row[-1], limit + 1)
+
+
+class SongIndex:
+    """Search index over song display strings.
+
+    Songs are indexed by the words of their folded display string, with
+    postings kept per song type. The word vocabulary itself is indexed by its
+    1, 2 and 3 character grams so a query word only has to be matched against
+    the few words sharing its grams instead of against every song.
+
+    Songs containing every query word are found first. When there are not
+    enough of those, query words are also matched against vocabulary words
+    within a small edit distance, found through their shared 3-grams. Results
+    are ranked by how well they match, then by the weight given to each song.
+    """
+
+    max_gram = 3
+
+    similar_cache_size = 4096
+
+    word = re.compile(r"\w+")
+
+    def __init__(self):
+        self.__entries: dict[str, tuple[str, str, str, float]] = {}
+        self.__postings: dict[str, dict[str, set[str]]] = {}
+        self.__word_refs: dict[str, int] = {}
+        self.__grams: dict[str, set[str]] = {}
+        self.__similar: dict[str, dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, id: str) -> bool:
+        return id in self.__entries
+
+    @staticmethod
+    def words(text: str) -> list[str]:
+        return SongIndex.word.findall(text)
+
+    def add(self, id: str, display: str, type: str, weight: float = 0):
+        """Index a song, songs with a higher ``weight`` are listed first among equally good matches."""
+        if id in self.__entries:
+            self.remove(id)
+
+        folded = " ".join(self.words(fold(display)))
+        self.__entries[id] = (display, folded, type, weight)
+
+        postings = self.__postings.setdefault(type, {})
+        for word in set(folded.split()):
+            postings.setdefault(word, set()).add(id)
+            self.__add_word(word)
+
+    def reweight(self, id: str, weight: float):
+        if (entry := self.__entries.get(id)) is not None:
+            self.__entries[id] = entry[:3] + (weight,)
+
+    def remove(self, id: str):
+        entry = self.__entries.pop(id, None)
+        if entry is None:
+            return
+
+        _, folded, type, _ = entry
+        postings = self.__postings[type]
+        for word in set(folded.split()):
+            ids = postings[word]
+            ids.discard(id)
+            if not ids:
+                del postings[word]
+            self.__remove_word(word)
+
+    def search(
+        self, query: str, types: Iterable[str], limit: int, within: set[str] = None
+    ) -> tuple[list[str], set[str]]:
+        """Returns the best ``limit`` matches and the ids of all songs containing every query word.
+
+        Those ids can be passed as ``within`` to a search for a query that extends this one,
+        which then only has to look at them.
+        """
+        query = " ".join(self.words(fold(query)))
+        types = set(types)
+
+        entries = self.__entries
+
+        tokens = sorted(set(query.split()), key=len, reverse=True)
+        if not tokens:
+            exact = {id for id, entry in entries.items() if entry[2] in types and (within is None or id in within)}
+            matches = [(0, 0, -entries[id][3], entries[id][1], entries[id][0]) for id in exact]
+            return [display for (*_, display) in heapq.nsmallest(limit, matches)], exact
+
+        # ranked on how the whole query appears in the song, then on the weight
+        if within is None:
+            exact = self.__matching(((token, self.__words_containing(token)) for token in tokens), types)
+        else:
+            # a token is part of a word exactly when it is part of the folded string
+            exact = {
+                id for id in within
+                if (entry := entries.get(id)) and entry[2] in types and all(token in entry[1] for token in tokens)
+            }
+        word_start = f" {query}"
+        matches = []
+        for id in exact:
+            display, folded, _, weight = entries[id]
+            if folded.startswith(query):
+                rank = 0
+            elif word_start in folded:
+                rank = 1
+            elif query in folded:
+                rank = 2
+            else:
+                rank = 3
+            matches.append((rank, 0, -weight, folded, display))
+
+        if len(matches) < limit:
+            similar = {token: self.__similar_words(token) for token in tokens}
+            for id in self.__matching(similar.items(), types) - exact:
+                display, folded, _, weight = entries[id]
+                words = set(folded.split())
+                edits = sum(
+                    min(e for w, e in similar[token].items() if w in words)
+                    for token in tokens
+                )
+                matches.append((4, edits, -weight, folded, display))
+
+        return [display for (*_, display) in heapq.nsmallest(limit, matches)], exact
+
+    def __matching(self, tokens: Iterable[tuple[str, Iterable[str]]], types: set[str]) -> set[str]:
+        """Songs that contain one of the words of every token."""
+        candidates = None
+        for _, words in tokens:
+            ids = self.__ids_for(words, types, candidates)
+            candidates = ids if candidates is None else candidates & ids
+            if not candidates:
+                return set()
+        return candidates
+
+    def __ids_for(self, words: Iterable[str], types: set[str], within: set[str]) -> set[str]:
+        ids = set()
+        for type in types:
+            postings = self.__postings.get(type)
+            if not postings:
+                continue
+            for word in words:
+                if found := postings.get(word):
+                    ids.update(found if within is None else found & within)
+        return ids
+
+    def __words_containing(self, token: str) -> Iterable[str]:
+        if len(token) <= SongIndex.max_gram:
+            return self.__grams.get(token, ())
+
+        grams = []
+        for i in range(len(token) - SongIndex.max_gram + 1):
+            words = self.__grams.get(token[i : i + SongIndex.max_gram])
+            if not words:
+                return ()
+            grams.append(words)
+
+        return [w for w in min(grams, key=len) if token in w]
+
+    def __similar_words(self, token: str) -> dict[str, int]:
+        """Vocabulary words that contain ``token`` or are, or start with, a slight misspelling of it."""
+        if (words := self.__similar.get(token)) is None:
+            if len(self.__similar) >= SongIndex.similar_cache_size:
+                self.__similar.clear()
+            words = self.__similar[token] = self.__find_similar_words(token)
+        return words
+
+    def __find_similar_words(self, token: str) -> dict[str, int]:
+        words = {word: 0 for word in self.__words_containing(token)}
+
+        limit = 0 if len(token) < 4 else 1 if len(token) < 8 else 2
+        if not limit:
+            return words
+
+        grams = [token[i : i + SongIndex.max_gram] for i in range(len(token) - SongIndex.max_gram + 1)]
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for word in self.__grams.get(gram, ()):
+                shared[word] = shared.get(word, 0) + 1
+
+        # an edit breaks at most three grams of the token, swapping two letters four
+        needed = max(1, len(grams) - 4 * limit)
+        for word, count in shared.items():
+            if count < needed or len(word) < len(token) - limit or word in words:
+                continue
+            edits = min(distance(token, word, limit), distance(token, word[: len(token)], limit))
+            if edits <= limit:
+                words[word] = edits
+
+        return words
+
+    def __add_word(self, word: str):
+        refs = self.__word_refs.get(word, 0)
+        self.__word_refs[word] = refs + 1
+        if refs:
+            return
+        self.__similar.clear()
+        for gram in self.__word_grams(word):
+            self.__grams.setdefault(gram, set()).add(word)
+
+    def __remove_word(self, word: str):
+        refs = self.__word_refs[word] - 1
+        if refs:
+            self.__word_refs[word] = refs
+            return
+        del self.__word_refs[word]
+        self.__similar.clear()
+        for gram in self.__word_grams(word):
+            words = self.__grams[gram]
+            words.discard(word)
+            if not words:
+                del self.__grams[gram]
+
+    def __word_grams(self, word: str) -> set[str]:
+        return {
+            word[i : i + n]
+            for n in range(1, SongIndex.max_gram + 1)
+            for i in range(len(word) - n + 1)
+        }
@@ -1,12 +1,22 @@
-from typing import Union
-from mido import MidiFile
+import asyncio
+import bisect
+from collections import Counter
+import contextlib
+import hashlib
+import itertools
+import logging
+from typing import AsyncIterator, Iterator, Union
 import os
+import re
 import shutil
 import uuid
 
 import discord
 
-from midibot import Store
+from midibot import BlobStore, Config, JournalStore, MidiAnalyser, Ratings, Song, SongIndex, SqliteStore, Store, ingest
+from midibot.metrics import registry as metrics
+
+_log = logging.getLogger(__name__)
 
 
 class Songs:
@@ -24,14 +34,81 @@ class Songs:
 
     all_types = [Type.VERIFIED, Type.REQUESTED, Type.UNVERIFIED]
 
-    def __init__(self):
-        self.songs = Store[list](f"data/songs.json", [])
-        os.makedirs("data/songs", exist_ok=True)
-        os.makedirs("data/output_files", exist_ok=True)
+    autocomplete_limit = 25
+
+    # search ranks a verified song like an unverified one rated this much higher
+    verified_weight = 2.5
+
+    def __init__(
+        self,
+        config: Config = None,
+        directory: str = "data",
+        blobs: BlobStore = None,
+        analyser: MidiAnalyser = None,
+    ):
+        """Songs stored in ``directory``, along with their files and analysis unless ``blobs`` and ``analyser`` are given.
+        Catalogues sharing ``blobs`` and ``analyser`` must be closed before them."""
+        config = config or Config()
+        self.directory = directory
+        self.generation = 0
+        self.__max_attachment_size = config.max_attachment_size
+        os.makedirs(directory, exist_ok=True)
+        if config.storage == "journal":
+            self.songs = JournalStore(f"{directory}/songs.json")
+        elif config.storage == "sqlite":
+            self.songs = SqliteStore(f"{directory}/songs.db", Songs.song_to_string, migrate_from=f"{directory}/songs.json")
+        else:
+            self.songs = Store[list](f"{directory}/songs.json", [], delay=config.sync_delay)
+        self.__own_analyser = analyser is None
+        self.__analyser = analyser or MidiAnalyser(
+            config.analysis_workers, f"{directory}/analysis.json", delay=config.sync_delay
+        )
+
+        self.__blobs = blobs or BlobStore(f"{directory}/blobs")
+        self.__meta = Store[dict](f"{directory}/meta.json", {})
+        self.__migrate()
+
+        self.songs.data = [Song.from_dict(s) for s in self.songs.data]
+        for s in self.songs.data:
+            for digest in (s.files or {}).values():
+                self.__blobs.reference(digest)
+
+        self.__search = SongIndex()
+        self.__by_id: dict[str, Song] = {}
+        self.__by_string: dict[str, list[Song]] = {}
+        self.__by_origin: dict[str, list[Song]] = {}
+        self.__order: dict[str, int] = {}
+        self.__sequence = itertools.count()
+        self.__by_rating: dict[str, list[tuple[float, int, str]]] = {}
+        self.__type_counts: Counter[str] = Counter()
+        self.__open_requests: Counter[int] = Counter()
+        self.__request_queue: list[tuple[int, int, str]] = []
+        self.__revisions: dict[str, int] = {}
+        self.__stamps: dict[str, int] = {}
+        self.__locks: dict[str, asyncio.Lock] = {}
+        for s in self.songs.data:
+            self.__index(s)
+
+    def __migrate(self):
+        migrations = [self.__import_song_files, self.__normalise_songs]
+
+        schema = self.__meta.data.get("schema", 0)
+        if schema < len(migrations):
+            for migration in migrations[schema:]:
+                migration()
+            self.songs.flush()
 
+            self.__meta.data["schema"] = len(migrations)
+            self.__meta.flush()
+            _log.info(f"Migrated songs from schema {schema} to {len(migrations)}")
+
+        # only once the songs referencing their copies are written
+        self.__remove_song_files()
+
+    def __normalise_songs(self):
         for s in self.songs.data:
             if not s["type"] == Songs.Type.UNVERIFIED:
-                s["type"] = Songs.Type.VERIFIED if Songs.File.MIDI in self.has_attachments(s) \
+                s["type"] = Songs.Type.VERIFIED if Songs.File.MIDI in s.get("files", {}) \
                     else Songs.Type.REQUESTED
             
             if "origin" not in s or s["origin"] == None:
@@ -40,187 +117,428 @@ class Songs:
             if "version" not in s or s["version"] == None:
                 s["version"] = ""
 
-        self.sync()
-
-    @property
-    def songlist(self):
-        return [self.song_to_string(x) for x in self.songs.data]
-    
-    @property
-    def songtuples(self):
-        return tuple((self.song_to_string(x), x) for x in self.songs.data)
-
-    def song_to_string(self, song_obj: dict) -> str:
-        string = f'{song_obj["artist"]} - {song_obj["song"]}'
-        if "version" in song_obj and song_obj["version"]:
-            string = string + f' ({song_obj["version"]})'
-        return string
-
-    def get(self, songstring) -> Union[None, dict]:
-        for song in self.songs.data:
-            if self.song_to_string(song) == songstring:
-                return song
+    @staticmethod
+    def song_to_string(song_obj: Union[Song, dict]) -> str:
+        if isinstance(song_obj, Song):
+            return song_obj.display
+        return Song.format(song_obj["artist"], song_obj["song"], song_obj.get("version"))
+
+    def normalise_origin(self, origin: str) -> str:
+        """Drops the scheme, www. and the fragment, only the host is case insensitive."""
+        origin = origin.strip().split("#", 1)[0]
+        for prefix in ("https://", "http://"):
+            if origin[: len(prefix)].lower() == prefix:
+                origin = origin[len(prefix):]
+                break
+        host, path = re.match(r"([^/?]*)(.*)", origin, re.DOTALL).groups()
+        return f"{host.lower().removeprefix('www.')}{path}".rstrip("/")
+
+    def get(self, songstring) -> Union[None, Song]:
+        if songs := self.__by_string.get(songstring):
+            return songs[0]
         return None
 
     def sync(self):
         self.songs.sync()
-    
-    async def song_search(self, search_string: str, types: list[str] = all_types) -> list[str]:
 
-        songs = self.songtuples
-        search_string = search_string.lower()
+    def batch(self):
+        """Context manager that persists all song changes made in it with a single sync, see ``Store.batch``."""
+        return self.songs.batch()
 
-        exact = [
-            song[0]
-            for song in songs
-            if song[1]["type"] in types and search_string in song[0].lower()
-        ]
+    @property
+    def blobs(self) -> BlobStore:
+        return self.__blobs
 
-        return exact
+    def close(self):
+        self.songs.close()
+        if self.__own_analyser:
+            self.__analyser.close()
 
-    def get_attachements(
-        self, song_obj: dict
-    ) -> Union[None, tuple[list[discord.File], list[str]]]:
+    def __touch(self, id: str):
+        self.generation += 1
+        self.__revisions[id] = self.generation
 
-        id = song_obj["id"]
-        files: list[str] = []
-        attachements: list[discord.File] = []
+    def revision(self, song_obj: Song) -> int:
+        return self.__revisions.get(song_obj.id, 0)
 
-        for ext in Songs.file_exts:
-            stored = f"data/songs/{id}{ext}"
-            nice = f"data/output_files/{self.song_to_string(song_obj)}{ext}"
+    def stamp(self, song_obj: Song) -> int:
+        """Changes whenever the fields or the type of the song change, but not when it is rated."""
+        return self.__stamps.get(song_obj.id, 0)
 
-            if os.path.exists(stored):
-                shutil.copy(stored, nice)
-                files.append(nice)
-                attachements.append(discord.File(nice))
+    def stale_error(self, song_obj: Song) -> Union[None, str]:
+        if self.__by_id.get(song_obj.id) is not song_obj:
+            return "That song has been removed in the meantime."
+        return None
 
-        return (files, attachements)
+    @contextlib.asynccontextmanager
+    async def transaction(self, song_obj: Song) -> AsyncIterator[Union[None, str]]:
+        """Hold the lock of ``song_obj`` so other transactions on it wait until this one is done.
+        Yields an error when the song was removed, either before or while waiting for the lock."""
+        lock = self.__locks.setdefault(song_obj.id, asyncio.Lock())
+        async with lock:
+            yield self.stale_error(song_obj)
+
+    def __index(self, song_obj: Song):
+        self.__touch(song_obj.id)
+        self.__stamps[song_obj.id] = self.generation
+        song_str = self.song_to_string(song_obj)
+        self.__by_id[song_obj.id] = song_obj
+        self.__by_string.setdefault(song_str, []).append(song_obj)
+        if song_obj.origin:
+            origin = self.normalise_origin(song_obj.origin)
+            self.__by_origin.setdefault(origin, []).append(song_obj)
+        self.__search.add(song_obj.id, song_str, song_obj.type, self.__search_weight(song_obj))
+        self.__rank(song_obj)
+        self.__count(song_obj, 1)
+        self.__enqueue(song_obj)
+
+    def __unindex(self, song_obj: Song):
+        self.generation += 1
+        self.__by_id.pop(song_obj.id, None)
+        self.__unlink(self.__by_string, self.song_to_string(song_obj), song_obj)
+        if song_obj.origin:
+            origin = self.normalise_origin(song_obj.origin)
+            self.__unlink(self.__by_origin, origin, song_obj)
+        self.__search.remove(song_obj.id)
+        self.__unrank(song_obj)
+        self.__count(song_obj, -1)
+        self.__dequeue(song_obj)
+
+    def __count(self, song_obj: Song, delta: int):
+        self.__type_counts[song_obj.type] += delta
+        if song_obj.type == Songs.Type.REQUESTED and song_obj.requested_by is not None:
+            self.__open_requests[song_obj.requested_by] += delta
+            if not self.__open_requests[song_obj.requested_by]:
+                del self.__open_requests[song_obj.requested_by]
+
+    def __queue_key(self, song_obj: Song) -> tuple[int, int, str]:
+        if not song_obj.origin:
+            bucket = 2
+        elif song_obj.origin.startswith("https://musescore.com/"):
+            bucket = 0
+        else:
+            bucket = 1
+        return (bucket, self.__position(song_obj.id), song_obj.id)
+
+    def __enqueue(self, song_obj: Song):
+        if song_obj.type == Songs.Type.REQUESTED:
+            bisect.insort(self.__request_queue, self.__queue_key(song_obj))
+
+    def __dequeue(self, song_obj: Song):
+        if song_obj.type != Songs.Type.REQUESTED:
+            return
+        key = self.__queue_key(song_obj)
+        i = bisect.bisect_left(self.__request_queue, key)
+        if i < len(self.__request_queue) and self.__request_queue[i] == key:
+            del self.__request_queue[i]
+
+    def open_requests(self) -> Iterator[Song]:
+        """Requests with a MuseScore link first, then other links, then without a link; oldest first."""
+        for (_, _, id) in self.__request_queue:
+            yield self.__by_id[id]
+
+    def __position(self, id: str) -> int:
+        if id not in self.__order:
+            self.__order[id] = next(self.__sequence)
+        return self.__order[id]
+
+    def __rating_key(self, song_obj: Song) -> tuple[float, int, str]:
+        return (-song_obj.rating, self.__position(song_obj.id), song_obj.id)
+
+    def __rank(self, song_obj: Song):
+        bisect.insort(self.__by_rating.setdefault(song_obj.type, []), self.__rating_key(song_obj))
+
+    def __unrank(self, song_obj: Song):
+        ranked = self.__by_rating.get(song_obj.type, [])
+        key = self.__rating_key(song_obj)
+        i = bisect.bisect_left(ranked, key)
+        if i < len(ranked) and ranked[i] == key:
+            del ranked[i]
+
+    def __search_weight(self, song_obj: Song) -> float:
+        verified = Songs.verified_weight if song_obj.type == Songs.Type.VERIFIED else 0
+        return song_obj.rating + verified
+
+    def by_rating(self, type: str) -> Iterator[Song]:
+        for (_, _, id) in self.__by_rating.get(type, []):
+            yield self.__by_id[id]
+
+    def __unlink(self, index: dict[str, list[Song]], key: str, song_obj: Song):
+        songs = index.get(key, [])
+        for i, x in enumerate(songs):
+            if x is song_obj:
+                del songs[i]
+                break
+        if not songs:
+            index.pop(key, None)
+
+    def __duplicates(self, index: dict[str, list[Song]], key: str, song_obj: Song = None) -> list[Song]:
+        return [x for x in index.get(key, []) if x is not song_obj]
     
-    def has_attachments(self, song_obj: dict) -> list:
-        id = song_obj["id"]
-        attachments = []
+    async def song_search(
+        self, search_string: str, types: list[str] = all_types, within: set[str] = None
+    ) -> tuple[list[str], set[str]]:
+        """The best matches and the ids of all songs matching the words, see ``SongIndex.search``."""
+        return self.__search.search(search_string, types, Songs.autocomplete_limit, within)
+
+    def __song_files(self) -> Iterator[tuple[os.DirEntry, dict, str]]:
+        """The files in data/songs with the song and the extension they belong to."""
+        if not os.path.isdir(f"{self.directory}/songs"):
+            return
+
+        songs = {s["id"]: s for s in self.songs.data}
+        with os.scandir(f"{self.directory}/songs") as entries:
+            for entry in entries:
+                id, ext = os.path.splitext(entry.name)
+                if ext in Songs.file_exts and id in songs and entry.is_file():
+                    yield entry, songs[id], ext
+
+    def __import_song_files(self):
+        """Copy the files in data/songs into the file store, the originals are removed by ``__remove_song_files``."""
+        for entry, song, ext in self.__song_files():
+            tmp = self.__blobs.temp_path()
+            try:
+                os.link(entry.path, tmp)
+            except OSError:
+                shutil.copyfile(entry.path, tmp)
+            song.setdefault("files", {})[ext] = self.__blobs.add(tmp)
+
+    def __remove_song_files(self):
+        if not os.path.isdir(f"{self.directory}/songs"):
+            return
+
+        for entry, song, ext in list(self.__song_files()):
+            if (digest := (song.get("files") or {}).get(ext)) and self.__blobs.exists(digest):
+                os.remove(entry.path)
+
+        try:
+            os.rmdir(f"{self.directory}/songs")
+        except OSError:
+            _log.warning(f"Files left in {self.directory}/songs that don't belong to any song")
+
+    def reconcile_attachments(self) -> bool:
+        stored = self.__blobs.stored()
+        changed = False
 
-        for ext in Songs.file_exts:
-            stored = f"data/songs/{id}{ext}"
+        for s in self.songs.data:
+            missing = [ext for ext, digest in (s.files or {}).items() if digest not in stored]
+            if missing:
+                _log.warning(f'Files missing for {self.song_to_string(s)}: {", ".join(missing)}')
+                for ext in missing:
+                    self.__blobs.release(s.files.pop(ext))
+                self.__touch(s.id)
+                self.songs.changed(s, "files")
+                changed = True
+
+        self.__blobs.collect_garbage()
+        return changed
+
+    def attachment_filename(self, song_obj: Song, ext: str) -> str:
+        name = self.song_to_string(song_obj).replace("/", "_").replace("\\", "_")
+        return f"{name}{ext}"
+
+    def get_attachements(self, song_obj: Song) -> list[discord.File]:
+        attachements: list[discord.File] = []
 
-            if os.path.exists(stored):
-                attachments.append(ext)
-        
-        return attachments
+        for ext in self.has_attachments(song_obj):
+            try:
+                attachements.append(
+                    discord.File(
+                        self.__blobs.path(song_obj.files[ext]),
+                        filename=self.attachment_filename(song_obj, ext),
+                    )
+                )
+            except FileNotFoundError:
+                _log.warning(f"{ext} file missing for {self.song_to_string(song_obj)}")
+
+        return attachements
+    
+    def bundle_entries(self, song_obj: Song, exts: list[str] = file_exts) -> list[tuple[str, str, str, int]]:
+        """Name, digest, path and size of the song's stored ``exts`` files, see ``midibot.bundles``."""
+        entries = []
+        for ext in self.has_attachments(song_obj):
+            if ext not in exts:
+                continue
+            digest = song_obj.files[ext]
+            path = self.__blobs.path(digest)
+            try:
+                entries.append((self.attachment_filename(song_obj, ext), digest, path, os.path.getsize(path)))
+            except FileNotFoundError:
+                _log.warning(f"{ext} file missing for {self.song_to_string(song_obj)}")
+        return entries
+
+    def has_attachments(self, song_obj: Song) -> list:
+        files = song_obj.files or {}
+        return [ext for ext in Songs.file_exts if ext in files]
 
     async def add_attachment(
-        self, song_obj: dict, attachment: discord.Attachment
+        self, song_obj: Song, attachment: discord.Attachment
     ) -> Union[None, str]:
+        """Download, check and attach a file. Only one upload per song should run at a time, see ``transaction``."""
+
+        ext = next((ext for ext in Songs.file_exts if attachment.filename.lower().endswith(ext)), None)
+        if ext is None:
+            return "I don't know what to do with that file. Make sure it is one of the following types:\n" + ", ".join(Songs.file_exts)
+
+        tmp = self.__blobs.temp_path()
+        digest = hashlib.sha256()
+
+        try:
+            with metrics.timer("midibot_attachment_seconds", stage="download"):
+                if error := await ingest.download(attachment.url, tmp, self.__max_attachment_size, digest):
+                    return error
+            metrics.count("midibot_attachment_bytes_total", os.path.getsize(tmp), ext=ext)
+
+            with metrics.timer("midibot_attachment_seconds", stage="validate"):
+                if error := await asyncio.to_thread(ingest.validate, tmp, ext):
+                    return error
+
+            with metrics.timer("midibot_attachment_seconds", stage="store"):
+                stored = self.__blobs.add(tmp, digest.hexdigest())
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+        self.__blobs.reference(stored)
+        if error := self.stale_error(song_obj):
+            self.__blobs.release(stored)
+            return error
+
+        if song_obj.files is None:
+            song_obj.files = {}
+        files = song_obj.files
+        if previous := files.get(ext):
+            self.__blobs.release(previous)
+        files[ext] = stored
+        self.songs.changed(song_obj, "files")
+        self.__touch(song_obj.id)
+
+        if song_obj.type == Songs.Type.REQUESTED and ext == Songs.File.MIDI:
+            self.__unindex(song_obj)
+            song_obj.type = Songs.Type.UNVERIFIED
+            self.__index(song_obj)
+            self.songs.changed(song_obj, "type")
+
+        if ext == Songs.File.MIDI:
+            with metrics.timer("midibot_attachment_seconds", stage="analyse"):
+                await self.__analyser.analyse(song_obj.id, self.__blobs.path(stored), stored)
+            if self.stale_error(song_obj):
+                self.__analyser.forget(song_obj.id)
+            else:
+                self.__touch(song_obj.id)
 
-        for ext in Songs.file_exts:
-            if attachment.filename.endswith(ext):
-                stored = f'data/songs/{song_obj["id"]}{ext}'
-                tmp = f'data/songs/tmp.{song_obj["id"]}{ext}'
-
-                # if ext == Songs.File.MIDI:
-                #     await attachment.save(tmp)
-                #     ok = self.check_tracks(tmp)
-                #     os.remove(tmp)
-
-                #     if not ok:
-                #         return "This midi file has more then 2 tracks and can't be used in PianoVision. Please find another midi file."
-
-                if os.path.exists(stored):
-                    os.remove(stored)
-
-                await attachment.save(stored)
-
-                if song_obj["type"] == Songs.Type.REQUESTED and ext == Songs.File.MIDI:
-                    song_obj["type"] = Songs.Type.UNVERIFIED
-                    self.sync()
-
-                return None
-            
-        return "I don't know what to do with that file. Make sure it is one of the following types:\n" + ", ".join(Songs.file_exts)
+        return None
     
-    def check_tracks(self, midifile:str) -> bool:
-        midi = MidiFile(midifile)
-        return len(midi.tracks) < 3
-
-    def remove(self, song_obj:dict) -> bool:
-
-        if song_obj == None:
+    def midi_info(self, song_obj: Song) -> Union[None, dict]:
+        return self.__analyser.get(song_obj.id)
+
+    async def analyse_missing(self):
+        async def analyse(song_obj: Song):
+            digest = song_obj.files[Songs.File.MIDI]
+            if await self.__analyser.analyse(song_obj.id, self.__blobs.path(digest), digest):
+                if self.stale_error(song_obj):
+                    self.__analyser.forget(song_obj.id)
+                else:
+                    self.__touch(song_obj.id)
+
+        await asyncio.gather(*(
+            analyse(s)
+            for s in self.songs.data
+            if Songs.File.MIDI in self.has_attachments(s) and not self.midi_info(s)
+        ))
+
+    def remove(self, song_obj:Song) -> bool:
+
+        if song_obj == None or self.stale_error(song_obj):
             return False
 
-        id = song_obj["id"]
-        for ext in Songs.file_exts:
-            stored = f"data/songs/{id}{ext}"
-
-            if os.path.exists(stored):
-                os.remove(stored)
+        id = song_obj.id
+        for digest in (song_obj.files or {}).values():
+            self.__blobs.release(digest)
 
         self.songs.data.remove(song_obj)
-        self.songs.sync()
+        self.__unindex(song_obj)
+        self.__order.pop(id, None)
+        self.__revisions.pop(id, None)
+        self.__stamps.pop(id, None)
+        self.__locks.pop(id, None)
+        self.__analyser.forget(id)
+        self.songs.removed(song_obj)
         return True
 
-    def rate(self, song_obj: dict, userid: int, rating: int) -> None:
-        if 5 < rating < 0:
+    def rate(self, song_obj: Song, userid: int, rating: int) -> bool:
+        if not 0 <= rating <= 5 or self.stale_error(song_obj):
             return False
 
-        if "ratings" not in song_obj:
-            song_obj["ratings"] = {}
-
-        song_obj["ratings"][f"{userid}"] = rating
-        ratings = list(song_obj["ratings"].values())
-        song_obj["rating"] = float(sum(ratings)) / len(ratings)
+        self.__unrank(song_obj)
+        if song_obj.ratings is None:
+            song_obj.ratings = Ratings()
+        song_obj.ratings.set(userid, rating)
+        self.__rank(song_obj)
+        self.__search.reweight(song_obj.id, self.__search_weight(song_obj))
+        self.__touch(song_obj.id)
 
-        self.songs.sync()
+        self.songs.changed(song_obj, "rating", f"ratings.{userid}")
         return True
     
-    def __generate_new_song(self) -> dict:
-        return {
-            "id": str(uuid.uuid4()),
-            "type": "verified"
-        }
+    def __generate_new_song(self) -> Song:
+        return Song(str(uuid.uuid4()), Songs.Type.VERIFIED)
     
-    def add_song(self, song_data: dict) -> Union[None, str]:
+    def duplicate_error(self, song_data: dict) -> Union[None, str]:
         song_str = self.song_to_string(song_data)
-        if song_str in self.songlist:
+        if self.__duplicates(self.__by_string, song_str):
             return "Song already exists in my database"
         
-        if song_data["origin"] and (duplicates := [x for x in self.songs.data if x["origin"] == song_data["origin"]]):
-            if duplicates[0]["type"] == Songs.Type.REQUESTED:
+        if song_data["origin"] and (duplicates := self.__duplicates(self.__by_origin, self.normalise_origin(song_data["origin"]))):
+            if duplicates[0].type == Songs.Type.REQUESTED:
                 return "That song has already been requested."
             return "Song with that URL is already in my database."
 
+        return None
+
+    def add_song(self, song_data: dict) -> Union[None, str]:
+        """Add a new song, ``files`` in ``song_data`` must already be in the file store."""
+        if error := self.duplicate_error(song_data):
+            return error
+
         song_obj = self.__generate_new_song()
         song_obj.update(song_data)
+        for digest in (song_obj.files or {}).values():
+            self.__blobs.reference(digest)
         self.songs.data.append(song_obj)
-        self.sync()
+        self.__index(song_obj)
+        self.songs.changed(song_obj)
+
+    def update(self, song_obj:Song, song_data: dict, stamp: int = None) -> Union[None, str]:
+        """Update the song, unless ``stamp`` is given and the song was changed after it was taken."""
+        if error := self.stale_error(song_obj):
+            return error
+        if stamp is not None and stamp != self.stamp(song_obj):
+            return "That song was changed by someone else in the meantime, please try again."
 
-    def update(self, song_obj:dict, song_data: dict) -> Union[None, str]:
         song_str = self.song_to_string(song_data)
-        if [x for x in self.songs.data if x is not song_obj and self.song_to_string(x) == song_str]:
+        if self.__duplicates(self.__by_string, song_str, song_obj):
             return "Song already exists in my database"
         
-        if song_data["origin"] and [x for x in self.songs.data if x is not song_obj and x["origin"] == song_data["origin"]]:
+        if song_data["origin"] and self.__duplicates(self.__by_origin, self.normalise_origin(song_data["origin"]), song_obj):
             return "Song with that URL is already in my database"
 
+        self.__unindex(song_obj)
         song_obj.update(song_data)
-        self.sync()
+        self.__index(song_obj)
+        self.songs.changed(song_obj, *song_data.keys())
+
+    def verify(self, song_obj:Song) -> Union[None, str]:
+        if error := self.stale_error(song_obj):
+            return error
 
-    def verify(self, song_obj:dict):
-        song_obj["type"] = Songs.Type.VERIFIED
-        self.sync()
+        self.__unindex(song_obj)
+        song_obj.type = Songs.Type.VERIFIED
+        self.__index(song_obj)
+        self.songs.changed(song_obj, "type")
 
     def request_count(self) -> int:
-        return len([
-            x
-            for x in self.songs.data
-            if x["type"] == Songs.Type.REQUESTED
-        ])
+        return self.__type_counts[Songs.Type.REQUESTED]
         
     def requests_for_user(self, user:int) -> int:
-        return len([
-            x
-            for x in self.songs.data
-            if x["type"] == Songs.Type.REQUESTED and
-            "requested_by" in x and
-            x["requested_by"] == user
-        ])
+        return self.__open_requests[user]
@@ -0,0 +1,166 @@
+import json
+import logging
+import os
+import sqlite3
+import sys
+from typing import Callable, Iterable, Union
+
+from midibot import Store
+from midibot.metrics import registry as metrics
+
+_log = logging.getLogger(__name__)
+
+schema = """
+CREATE TABLE IF NOT EXISTS songs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    display TEXT NOT NULL,
+    origin TEXT NOT NULL DEFAULT '',
+    requested_by INTEGER,
+    rating REAL NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ratings (
+    song_id TEXT NOT NULL REFERENCES songs (id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    rating INTEGER NOT NULL,
+    PRIMARY KEY (song_id, user_id)
+);
+"""
+
+
+class SqliteStore(Store[list]):
+    """Store for the song list backed by a SQLite database.
+
+    Only used for persistence, the song list is loaded into memory like with
+    the other stores. Every change is written as a single row upsert, with
+    ratings in their own table, and a batch only writes the rows it changed.
+    The type, display, origin, requester and rating columns are only there
+    to make the database readable with other tools. When the database is new
+    and ``migrate_from`` points to a JSON song list, that list is imported
+    once.
+    """
+
+    def __init__(self, file: str, display: Callable[[dict], str], migrate_from: str = None):
+        self.__display = display
+        self.__migrate_from = migrate_from
+        # songs changed during a batch by id, None when removed
+        self.__batched: dict[str, Union[None, dict]] = {}
+        super().__init__(file, [])
+
+    def _load(self) -> list:
+        self.__db = sqlite3.connect(self.file)
+        self.__db.execute("PRAGMA journal_mode = WAL")
+        self.__db.execute("PRAGMA synchronous = NORMAL")
+        self.__db.execute("PRAGMA foreign_keys = ON")
+        self.__db.executescript(schema)
+
+        empty = self.__db.execute("SELECT COUNT(*) FROM songs").fetchone()[0] == 0
+        if empty and self.__migrate_from and os.path.exists(self.__migrate_from):
+            with open(self.__migrate_from, "r") as file:
+                songs = json.load(file)
+            with self.__db:
+                self.__put_all(songs)
+            _log.info(f"Imported {len(songs)} songs from '{self.__migrate_from}' into '{self.file}'")
+
+        songs: dict[str, dict] = {}
+        for id, data in self.__db.execute("SELECT id, data FROM songs ORDER BY rowid"):
+            songs[id] = json.loads(data)
+        for song_id, user_id, rating in self.__db.execute("SELECT song_id, user_id, rating FROM ratings"):
+            songs[song_id].setdefault("ratings", {})[user_id] = rating
+
+        return list(songs.values())
+
+    def sync(self):
+        with metrics.timer("midibot_store_sync_seconds", file=self.file), self.__db:
+            self.__db.execute("CREATE TEMP TABLE IF NOT EXISTS keep (id TEXT PRIMARY KEY)")
+            self.__db.execute("DELETE FROM keep")
+            songs = [self.encode(s) for s in self.data]
+            self.__db.executemany("INSERT OR IGNORE INTO keep VALUES (?)", ((s["id"],) for s in songs))
+            self.__db.execute("DELETE FROM songs WHERE id NOT IN (SELECT id FROM keep)")
+            self.__put_all(songs)
+
+    def flush(self):
+        self.sync()
+
+    def changed(self, item, *keys: str):
+        item = self.encode(item)
+        if self.batching:
+            self.__batched[item["id"]] = item
+            return
+        with metrics.timer("midibot_store_sync_seconds", file=self.file), self.__db:
+            self.__put(item)
+
+            if not keys:
+                self.__db.execute("DELETE FROM ratings WHERE song_id = ?", (item["id"],))
+                keys = [f"ratings.{user}" for user in item.get("ratings", {})]
+
+            self.__db.executemany(
+                "INSERT INTO ratings VALUES (?, ?, ?) "
+                "ON CONFLICT (song_id, user_id) DO UPDATE SET rating = excluded.rating",
+                (
+                    (item["id"], user, item["ratings"][user])
+                    for (field, _, user) in (key.partition(".") for key in keys)
+                    if field == "ratings" and user
+                ),
+            )
+
+    def removed(self, item):
+        id = self.encode(item)["id"]
+        if self.batching:
+            self.__batched[id] = None
+            return
+        with metrics.timer("midibot_store_sync_seconds", file=self.file), self.__db:
+            self.__db.execute("DELETE FROM songs WHERE id = ?", (id,))
+
+    def _write_batch(self):
+        batched, self.__batched = self.__batched, {}
+        if not batched:
+            return
+        with metrics.timer("midibot_store_sync_seconds", file=self.file), self.__db:
+            self.__db.executemany("DELETE FROM songs WHERE id = ?", ((id,) for id, item in batched.items() if item is None))
+            self.__db.executemany("DELETE FROM ratings WHERE song_id = ?", ((id,) for id in batched))
+            self.__put_all(item for item in batched.values() if item is not None)
+
+    def close(self):
+        self.__db.close()
+
+    def __put_all(self, songs: Iterable[dict]):
+        for song in songs:
+            self.__put(song)
+            self.__db.executemany(
+                "INSERT OR REPLACE INTO ratings VALUES (?, ?, ?)",
+                ((song["id"], user, rating) for user, rating in song.get("ratings", {}).items()),
+            )
+
+    def __put(self, item: dict):
+        data = {key: value for key, value in item.items() if key != "ratings"}
+        self.__db.execute(
+            "INSERT INTO songs (id, type, display, origin, requested_by, rating, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (id) DO UPDATE SET type = excluded.type, display = excluded.display, "
+            "origin = excluded.origin, requested_by = excluded.requested_by, "
+            "rating = excluded.rating, data = excluded.data",
+            (
+                item["id"],
+                item["type"],
+                self.__display(item),
+                item.get("origin") or "",
+                item.get("requested_by"),
+                item.get("rating", 0),
+                json.dumps(data),
+            ),
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python -m midibot.sqlitestore <songs.json> <songs.db>")
+        sys.exit(1)
+
+    from midibot import Songs
+
+    store = SqliteStore(sys.argv[2], Songs.song_to_string, migrate_from=sys.argv[1])
+    print(f"'{sys.argv[2]}' holds {len(store.data)} songs")
+    store.close()
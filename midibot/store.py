@@ -1,22 +1,32 @@
+import asyncio
+import contextlib
 import json
 import os
+import threading
 from typing import Generic, TypeVar
 
+from midibot.metrics import registry as metrics
+
 T = TypeVar('T')
 
 
 class Store(Generic[T]):
 
-    def __init__(self, file: str, empty: T):
+    def __init__(self, file: str, empty: T, delay: float = 0):
         self.__file = file
         self.__empty = empty
-        self.data: T = self.__load()
+        self.__delay = delay
+        self.__dirty = False
+        self.__flusher: asyncio.Task = None
+        self.__lock = threading.Lock()
+        self.__batching = False
+        self.data: T = self._load()
 
     @property
     def file(self):
         return self.__file
 
-    def __load(self) -> T:
+    def _load(self) -> T:
         try:
             with open(self.__file, 'r') as file:
                 return json.load(file)
@@ -28,5 +38,90 @@ class Store(Generic[T]):
             return self.__empty
 
     def sync(self):
-        with open(self.__file, 'w') as jsonfile:
-            json.dump(self.data, jsonfile, indent=4)
+        """Persist the data; on an event loop, writes within the delay window are coalesced."""
+        if self.__delay <= 0:
+            self._write()
+            return
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write()
+            return
+
+        self.__dirty = True
+        if self.__flusher is None or self.__flusher.done():
+            self.__flusher = loop.create_task(self.__flush_later())
+
+    def flush(self):
+        """Persist the data right away, also on an event loop."""
+        self._write()
+
+    @property
+    def batching(self) -> bool:
+        return self.__batching
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Changes made in the body are only kept in memory, and persisted with a single sync at the end."""
+        if self.__batching:
+            yield
+            return
+
+        self.__batching = True
+        try:
+            yield
+        finally:
+            self.__batching = False
+            self._write_batch()
+
+    def _write_batch(self):
+        """Persist the changes made in a batch, by default with a sync of all the data."""
+        self.sync()
+
+    @staticmethod
+    def encode(item):
+        """Turn items that aren't plain JSON values into JSON values."""
+        return item.to_dict() if hasattr(item, "to_dict") else item
+
+    def changed(self, item, *keys: str):
+        """Called after ``keys`` of ``item`` (all of them when omitted) have been changed or added."""
+        if not self.__batching:
+            self.sync()
+
+    def removed(self, item):
+        if not self.__batching:
+            self.sync()
+
+    def close(self):
+        if self.__dirty:
+            self._write()
+
+    def _snapshot(self) -> T:
+        """A shallow copy of the data, cheap enough to take on the event loop so that
+        a worker thread can serialise it while the loop keeps changing the data."""
+        if isinstance(self.data, (list, dict)):
+            return type(self.data)(self.data)
+        return self.data
+
+    async def __flush_later(self):
+        while self.__dirty:
+            await asyncio.sleep(self.__delay)
+            self.__dirty = False
+            await asyncio.to_thread(self._write, self._snapshot())
+
+    def _write(self, data: T = None):
+        if data is None:
+            self.__dirty = False
+            data = self._snapshot()
+
+        with self.__lock, metrics.timer("midibot_store_sync_seconds", file=self.__file):
+            text = json.dumps(data, default=Store.encode)
+
+            tmp = f"{self.__file}.tmp"
+            with open(tmp, 'w') as jsonfile:
+                jsonfile.write(text)
+                jsonfile.flush()
+                os.fsync(jsonfile.fileno())
+            os.replace(tmp, self.__file)
+            metrics.count("midibot_store_written_bytes_total", len(text), file=self.__file)
@@ -0,0 +1,115 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from midibot import JournalStore
+
+
+class Item:
+    """A song stand-in that can run a hook while it is encoded by the compaction thread."""
+
+    def __init__(self, id: str):
+        self.id = id
+        self.on_encode = None
+
+    def to_dict(self) -> dict:
+        if self.on_encode is not None:
+            self.on_encode()
+        return {"id": self.id}
+
+
+class TestJournalStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "songs.json")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_log(self, file: str, records: list[dict], torn: str = ""):
+        with open(file, "w") as log:
+            for record in records:
+                log.write(json.dumps(record) + "\n")
+            log.write(torn)
+
+    def ids(self, store: JournalStore) -> list[str]:
+        return sorted(item["id"] for item in store.data)
+
+    def test_compaction_racing_removal(self):
+        async def race():
+            loop = asyncio.get_running_loop()
+            store = JournalStore(self.file)
+            items = [Item(f"{i}") for i in range(10)]
+            for item in items:
+                store.data.append(item)
+                store.changed(item)
+
+            removed = threading.Event()
+
+            def remove():
+                store.data.remove(items[0])
+                store.removed(items[0])
+                removed.set()
+
+            def remove_while_encoding():
+                items[1].on_encode = None
+                loop.call_soon_threadsafe(remove)
+                removed.wait()
+
+            items[1].on_encode = remove_while_encoding
+            store.compact()
+            await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+            store.close()
+
+        asyncio.run(race())
+
+        store = JournalStore(self.file)
+        self.assertEqual(self.ids(store), [f"{i}" for i in range(1, 10)])
+        store.close()
+
+    def test_replay_ignores_torn_record(self):
+        records = [
+            {"op": "put", "item": {"id": "a"}},
+            {"op": "put", "item": {"id": "b"}},
+        ]
+        self.write_log(f"{self.file}.log", records, torn='{"op": "del", "id": "a')
+
+        store = JournalStore(self.file)
+        self.assertEqual(self.ids(store), ["a", "b"])
+        store.close()
+
+        store = JournalStore(self.file)
+        self.assertEqual(self.ids(store), ["a", "b"])
+        store.close()
+
+    def test_replay_twice(self):
+        records = [
+            {"op": "put", "item": {"id": "a"}},
+            {"op": "put", "item": {"id": "b"}},
+            {"op": "set", "id": "a", "fields": {"rating": 4.5, "ratings.1": 5}},
+            {"op": "del", "id": "b"},
+            {"op": "del", "id": "c"},
+        ]
+        expected = [{"id": "a", "rating": 4.5, "ratings": {"1": 5}}]
+
+        # a crash after the snapshot was written but before the rotated log was removed
+        with open(self.file, "w") as snapshot:
+            json.dump(expected, snapshot)
+        self.write_log(f"{self.file}.log.1", records)
+        self.write_log(f"{self.file}.log", records)
+
+        store = JournalStore(self.file)
+        self.assertEqual(store.data, expected)
+        store.close()
+
+        self.assertFalse(os.path.exists(f"{self.file}.log.1"))
+        store = JournalStore(self.file)
+        self.assertEqual(store.data, expected)
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
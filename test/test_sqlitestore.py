@@ -0,0 +1,71 @@
+import os
+import tempfile
+import unittest
+
+from midibot import SqliteStore
+
+
+def display(song: dict) -> str:
+    return song["song"]
+
+
+def song(id: str, **fields) -> dict:
+    return {"id": id, "type": "verified", "song": f"Song {id}", **fields}
+
+
+class TestSqliteStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.directory.name, "songs.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def reopen(self, store: SqliteStore) -> SqliteStore:
+        store.close()
+        return SqliteStore(self.file, display)
+
+    def test_batch_writes_changed_rows(self):
+        store = SqliteStore(self.file, display)
+        for i in range(5):
+            store.data.append(song(f"{i}", ratings={"1": 3}))
+            store.changed(store.data[-1])
+
+        with store.batch():
+            added = song("5")
+            store.data.append(added)
+            store.changed(added)
+
+            rated = store.data[1]
+            rated["ratings"] = {"2": 5}
+            store.changed(rated, "ratings.2")
+
+            removed = store.data.pop(2)
+            store.removed(removed)
+
+            # added and removed within the same batch
+            store.data.remove(added)
+            store.removed(added)
+
+        expected = [song("0", ratings={"1": 3}), song("1", ratings={"2": 5})] + [
+            song(f"{i}", ratings={"1": 3}) for i in (3, 4)
+        ]
+        store = self.reopen(store)
+        self.assertEqual(store.data, expected)
+        store.close()
+
+    def test_sync_writes_everything(self):
+        store = SqliteStore(self.file, display)
+        store.data = [song("a"), song("b", ratings={"1": 4})]
+        store.sync()
+
+        store.data.pop(0)
+        store.sync()
+
+        store = self.reopen(store)
+        self.assertEqual(store.data, [song("b", ratings={"1": 4})])
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()